@@ -1,9 +1,29 @@
-from flask import Flask, request, render_template_string, redirect, abort
+from flask import Flask, Response, request, stream_template, redirect, abort, g, session, url_for, jsonify
+from markupsafe import Markup, escape
 import os
+import re
+import json
+import gzip
+import time
+import queue
+import select
+import hmac
+import base64
+import hashlib
+import threading
+from datetime import date, timedelta
 import psycopg2
-import telegram
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 import logging
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # API responses fall back to gzip
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -13,38 +33,563 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 datetime_format = "%Y-%m-%d %H:%M:%S"
-TOKEN_TTL_MINUTES = 10
+SESSION_TTL_MINUTES = int(os.getenv("SESSION_TTL_MINUTES", "60"))
+REVOCATION_REFRESH_SECONDS = 30
+DEFAULT_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 500
+STATUSES = ['New', 'In Progress', 'Accepted', 'Declined']
+# Live updates: comment sent to idle event streams, and changes buffered per slow client before it is dropped
+SSE_KEEPALIVE_SECONDS = 15
+SSE_QUEUE_SIZE = 1000
+# API responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+# Telegram's limit for one message
+BROADCAST_MAX_LENGTH = 4096
+APPLICANT_FIELDS = ("id", "name", "age", "city", "phone", "username", "telegram_id", "status", "accepted_city", "accepted_date")
+APPLICANT_SELECT = """
+    SELECT id, name, age, city, phone, username, telegram_id, status,
+           accepted_city, accepted_date::text
+    FROM applicants
+"""
 
 app = Flask(__name__)
 DB_URL = os.getenv("DATABASE_URL")
-BOT_TOKEN = os.getenv("BOT_TOKEN")
 GROUP_ID = int(os.getenv("GROUP_ID", "0"))
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+# Shared with the bot, which signs the links it hands out
+ADMIN_TOKEN_SECRET = os.getenv("ADMIN_TOKEN_SECRET")
+if not ADMIN_TOKEN_SECRET:
+    raise RuntimeError("ADMIN_TOKEN_SECRET is not set; it has to be the same value the bot signs admin links with")
+
+# Session cookies get their own key, derived from the link secret unless SECRET_KEY is set
+app.secret_key = os.getenv("SECRET_KEY") or hmac.new(
+    ADMIN_TOKEN_SECRET.encode(), b"admin-panel-session", hashlib.sha256
+).hexdigest()
+app.config.update(
+    SESSION_COOKIE_HTTPONLY=True,
+    SESSION_COOKIE_SAMESITE="Lax",
+    SESSION_COOKIE_SECURE=os.getenv("SESSION_COOKIE_SECURE", "1") == "1",
+    PERMANENT_SESSION_LIFETIME=timedelta(minutes=SESSION_TTL_MINUTES)
+)
+
+# Connection pool settings (acquire timeout is in seconds)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Must equal the last version in MIGRATIONS (LATEST_VERSION) in background-task/migrations.py.
+# The panel is deployed without the bot's code, so it is kept by hand: bump it with every new migration.
+# The bot applies the migrations; the panel waits for them at startup and answers 503 until they are in.
+SCHEMA_VERSION = 5
+SCHEMA_POLL_SECONDS = 2
+
+# Prometheus metrics are served on this port when it is set
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+
+REQUEST_DURATION = Histogram(
+    "panel_request_duration_seconds", "Time until a response is returned; streamed pages keep sending after", ["endpoint"]
+)
+REQUESTS = Counter("panel_requests_total", "Requests by endpoint and status code", ["endpoint", "status"])
+DB_QUERY_DURATION = Histogram(
+    "panel_db_query_duration_seconds", "Database statement latency", ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+DB_QUERY_ERRORS = Counter("panel_db_query_errors_total", "Failed database statements", ["statement"])
+DB_CONNECTIONS_IN_USE = Gauge("panel_db_connections_in_use", "Pooled connections held by requests")
+LIVE_CLIENTS = Gauge("panel_live_clients", "Open live update streams")
+# Labels statements by verb and first table, e.g. "SELECT applicants", to keep the series count bounded
+STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+def statement_label(query):
+    if isinstance(query, bytes):
+        query = query.decode()
+    words = query.split(None, 1)
+    if not words:
+        return "EMPTY"
+    match = STATEMENT_TABLE.search(query)
+    return f"{words[0].upper()} {match.group(1).lower()}" if match else words[0].upper()
+
+@contextmanager
+def observe_query(query):
+    label = statement_label(query)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(label).inc()
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(label).observe(time.perf_counter() - started)
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        with observe_query(query):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with observe_query(query):
+            return super().executemany(query, vars_list)
+
+db_pool = None
+db_pool_lock = threading.Lock()
+# ThreadedConnectionPool fails straight away when exhausted, so requests queue here instead
+db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+
+# Set once the database has reached SCHEMA_VERSION
+schema_ready = False
+
+# Sessions ended early through /logout, refreshed from the database every REVOCATION_REFRESH_SECONDS
+revoked_sids = set()
+revoked_refreshed_at = 0.0
+revoked_lock = threading.Lock()
+
+# applicant_changes notifications, fanned out to every open event stream of this process
+change_subscribers = set()
+change_lock = threading.Lock()
+change_listener = None
 
 logger.info(f"Starting admin panel with GROUP_ID: {GROUP_ID}, ADMIN_ID: {ADMIN_ID}")
 
+def get_db_pool():
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                db_pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_URL, cursor_factory=TimedCursor)
+                logger.info(f"Database pool created (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return db_pool
+
+def get_db():
+    # One pooled connection per request, returned in release_db
+    if "db_conn" not in g:
+        if not db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            logger.error("Database pool exhausted, rejecting request")
+            abort(503)
+        try:
+            g.db_conn = get_db_pool().getconn()
+        except Exception:
+            db_pool_slots.release()
+            raise
+        DB_CONNECTIONS_IN_USE.inc()
+    return g.db_conn
+
+def current_schema_version(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT max(version) FROM schema_version")
+        return cur.fetchone()[0] or 0
+    except psycopg2.errors.UndefinedTable:
+        return 0
+    finally:
+        conn.rollback()
+        cur.close()
+
+def wait_for_schema():
+    global schema_ready
+    # A single query once the bot has migrated the database
+    pool = get_db_pool()
+    conn = pool.getconn()
+    waiting = False
+    try:
+        while True:
+            version = current_schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                logger.info(f"Database schema version {version} is ready")
+                schema_ready = True
+                return
+            if not waiting:
+                logger.warning(f"Database schema is at version {version}, waiting for the bot to migrate it to {SCHEMA_VERSION}")
+                waiting = True
+            time.sleep(SCHEMA_POLL_SECONDS)
+    finally:
+        pool.putconn(conn)
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop("db_conn", None)
+    if conn is None:
+        return
+    try:
+        # The pool rolls back any transaction left open and drops broken connections
+        get_db_pool().putconn(conn, close=bool(conn.closed))
+    finally:
+        db_pool_slots.release()
+        DB_CONNECTIONS_IN_USE.dec()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def require_schema():
+    # Under a WSGI server nothing calls wait_for_schema, so the first requests check the version instead
+    global schema_ready
+    if schema_ready:
+        return
+    version = current_schema_version(get_db())
+    if version < SCHEMA_VERSION:
+        logger.warning(f"Database schema is at version {version}, waiting for the bot to migrate it to {SCHEMA_VERSION}")
+        abort(503)
+    logger.info(f"Database schema version {version} is ready")
+    schema_ready = True
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unknown"
+    if "request_started" in g:
+        REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+def sign_admin_payload(payload):
+    digest = hmac.new(ADMIN_TOKEN_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def is_revoked(sid):
+    global revoked_sids, revoked_refreshed_at
+    if time.monotonic() - revoked_refreshed_at > REVOCATION_REFRESH_SECONDS:
+        with revoked_lock:
+            if time.monotonic() - revoked_refreshed_at > REVOCATION_REFRESH_SECONDS:
+                try:
+                    conn = get_db()
+                    cur = conn.cursor()
+                    cur.execute("SELECT sid FROM revoked_admin_sessions WHERE expires_at > now()")
+                    revoked_sids = {row[0] for row in cur.fetchall()}
+                    conn.commit()
+                    cur.close()
+                except Exception as e:
+                    logger.error(f"Error refreshing revoked sessions: {str(e)}")
+                revoked_refreshed_at = time.monotonic()
+    return sid in revoked_sids
+
+def session_revoked(sid):
+    # For event streams, which run outside the request and hold no connection between checks
+    if not db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        return sid in revoked_sids
+    pool = get_db_pool()
+    conn = None
+    try:
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM revoked_admin_sessions WHERE sid = %s AND expires_at > now()", (sid,))
+        revoked = cur.fetchone() is not None
+        conn.commit()
+        cur.close()
+        return revoked
+    except Exception as e:
+        logger.error(f"Error checking session revocation: {str(e)}")
+        return sid in revoked_sids
+    finally:
+        if conn is not None:
+            pool.putconn(conn, close=bool(conn.closed))
+        db_pool_slots.release()
+
 def validate_token(token):
+    # Token format is <telegram_id>.<expires_at>.<nonce>.<signature>, signed by the bot
+    if not token:
+        return None
     logger.info(f"Validating token: {token[:8]}...")
-    conn = psycopg2.connect(DB_URL)
-    cur = conn.cursor()
-    
-    # Clean up expired tokens
-    cur.execute("DELETE FROM admin_tokens WHERE now() - created_at > interval '%s minutes'", (TOKEN_TTL_MINUTES,))
-    
-    # Check if token exists and is valid
-    cur.execute("SELECT telegram_id FROM admin_tokens WHERE token = %s", (token,))
-    result = cur.fetchone()
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-    
-    if not result:
+
+    try:
+        telegram_id, expires_at, nonce, signature = token.split(".")
+        valid = hmac.compare_digest(signature, sign_admin_payload(f"{telegram_id}.{expires_at}.{nonce}"))
+        if valid and int(expires_at) < time.time():
+            logger.warning(f"Token expired: {token[:8]}...")
+            valid = False
+    except (ValueError, TypeError):
+        # TypeError: compare_digest refuses non-ASCII signatures
+        valid = False
+
+    if not valid or is_revoked(nonce):
         logger.warning(f"Token validation failed: {token[:8]}...")
         return None
-    
-    logger.info(f"Token validated successfully for user_id: {result[0]}")
-    return result[0]  # Return the telegram_id associated with the token
+
+    logger.info(f"Token validated successfully for user_id: {telegram_id}")
+    return int(telegram_id), nonce  # The telegram_id the bot signed the token for, and its nonce
+
+def start_admin_session(telegram_id, sid):
+    # The signed session cookie replaces the token for every following request
+    session.clear()
+    session.permanent = True
+    session["admin_id"] = telegram_id
+    session["sid"] = sid
+    session["expires_at"] = int(time.time()) + SESSION_TTL_MINUTES * 60
+
+def current_admin():
+    telegram_id = session.get("admin_id")
+    if telegram_id is None:
+        return None
+    if session.get("expires_at", 0) < time.time() or is_revoked(session.get("sid")):
+        session.clear()
+        return None
+    return telegram_id
+
+def subscribe_changes():
+    global change_listener
+    with change_lock:
+        if change_listener is None:
+            # One LISTEN connection per process, started with the first live client
+            change_listener = threading.Thread(target=listen_for_changes, name="applicant-changes", daemon=True)
+            change_listener.start()
+        q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        change_subscribers.add(q)
+    return q
+
+def unsubscribe_changes(q):
+    with change_lock:
+        change_subscribers.discard(q)
+
+def publish_change(payload):
+    with change_lock:
+        subscribers = list(change_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(payload)
+        except queue.Full:
+            # The client fell too far behind; ask it to reload instead
+            unsubscribe_changes(q)
+            q.queue.clear()
+            q.put_nowait(None)
+
+def listen_for_changes():
+    reconnecting = False
+    while True:
+        try:
+            conn = psycopg2.connect(DB_URL)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute("LISTEN applicant_changes")
+            logger.info("Listening for applicant changes")
+            if reconnecting:
+                # Changes made while disconnected were missed
+                publish_change(json.dumps({"op": "reload"}))
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    publish_change(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.error(f"Applicant change listener failed, reconnecting: {str(e)}")
+            reconnecting = True
+            time.sleep(5)
+
+def notify_applicants_changed(cur, applicant_ids):
+    # Delivered on commit to the bot and every panel process
+    cur.execute("""
+        SELECT pg_notify('applicant_changes', json_build_object('op', 'upsert', 'row', json_build_object(
+            'id', id, 'name', name, 'age', age, 'city', city, 'phone', phone, 'username', username,
+            'telegram_id', telegram_id, 'status', status,
+            'accepted_city', accepted_city, 'accepted_date', accepted_date::text
+        ))::text)
+        FROM applicants WHERE telegram_id = ANY(%s)
+    """, (applicant_ids,))
+
+def notify_applicants_deleted(cur, applicant_ids):
+    cur.execute("""
+        SELECT pg_notify('applicant_changes', json_build_object('op', 'delete', 'telegram_id', id)::text)
+        FROM unnest(%s::bigint[]) AS id
+    """, (applicant_ids,))
+
+def set_applicant_status(cur, applicant_ids, new_status, accepted_city=None, accepted_date=None):
+    # One UPDATE for any number of applicants; returns the number of rows changed.
+    # Applicants already in that state are left alone, so they are not announced again.
+    if new_status == "Accepted" and accepted_city and accepted_date:
+        cur.execute("""
+            UPDATE applicants
+            SET status = %s, accepted_city = %s, accepted_date = %s
+            WHERE telegram_id = ANY(%s)
+              AND (status, accepted_city, accepted_date) IS DISTINCT FROM (%s, %s, %s::date)
+            RETURNING telegram_id
+        """, (new_status, accepted_city, accepted_date, applicant_ids, new_status, accepted_city, accepted_date))
+    else:
+        cur.execute(
+            "UPDATE applicants SET status = %s WHERE telegram_id = ANY(%s) AND status IS DISTINCT FROM %s RETURNING telegram_id",
+            (new_status, applicant_ids, new_status)
+        )
+    updated = [r[0] for r in cur.fetchall()]
+    if updated:
+        notify_applicants_changed(cur, updated)
+
+    if new_status in ("Accepted", "Declined"):
+        remove_topic_mappings(cur, applicant_ids)
+    return len(updated)
+
+def delete_applicants(cur, applicant_ids):
+    remove_topic_mappings(cur, applicant_ids)
+    cur.execute("DELETE FROM applicants WHERE telegram_id = ANY(%s) RETURNING telegram_id", (applicant_ids,))
+    deleted = [r[0] for r in cur.fetchall()]
+    notify_applicants_deleted(cur, deleted)
+    return len(deleted)
+
+def remove_topic_mappings(cur, applicant_ids):
+    cur.execute("DELETE FROM topic_mappings WHERE telegram_id = ANY(%s) RETURNING telegram_id, thread_id", (applicant_ids,))
+    rows = cur.fetchall()
+    if not rows:
+        return
+    # Delivered on commit; the bot drops the mappings from its topic cache
+    cur.execute("SELECT pg_notify('topic_mappings', id::text) FROM unnest(%s::bigint[]) AS id", ([r[0] for r in rows],))
+    # The bot deletes the forum topics; queued in this transaction so they go exactly when the change commits
+    cur.execute("""
+        INSERT INTO bot_outbox (action, payload)
+        SELECT 'delete_forum_topic', jsonb_build_object('thread_id', thread_id)
+        FROM unnest(%s::int[]) AS thread_id
+    """, ([r[1] for r in rows],))
+    cur.execute("NOTIFY bot_outbox")
+    logger.info(f"Removed {len(rows)} topic mappings and queued their forum topics for deletion")
+
+def create_broadcast(cur, text, status, city, created_by):
+    # Same as create_broadcast in the bot; the bot sends it once notified
+    cur.execute("""
+        INSERT INTO broadcasts (text, status_filter, city_filter, created_by)
+        VALUES (%s, %s, %s, %s) RETURNING id
+    """, (text, status, city, created_by))
+    broadcast_id = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO broadcast_recipients (broadcast_id, telegram_id)
+        SELECT %s, telegram_id FROM applicants
+        WHERE (%s::text IS NULL OR status = %s)
+          AND (%s::text IS NULL OR lower(city) = lower(%s) OR lower(accepted_city) = lower(%s))
+    """, (broadcast_id, status, status, city, city, city))
+    total = cur.rowcount
+    cur.execute("UPDATE broadcasts SET total = %s WHERE id = %s", (total, broadcast_id))
+    cur.execute("NOTIFY broadcasts")
+    return broadcast_id, total
+
+def row_renderer(is_admin, current_url):
+    return lambda user: Markup(row_template.render(user=user, is_admin=is_admin, current_url=current_url))
+
+def page_etag(version, is_admin):
+    # The same data version, role and URL always render the same page
+    key = f"{TEMPLATE_DIGEST}:{version}:{int(is_admin)}:{request.full_path}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def applicants_query(status_filter, before, limit):
+    # Newest first; keyset pagination starts each page below the last id of the previous one
+    query = APPLICANT_SELECT
+    conditions = []
+    params = []
+
+    if status_filter:
+        conditions.append("status = %s")
+        params.append(status_filter)
+    if before:
+        conditions.append("id < %s")
+        params.append(before)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += " ORDER BY id DESC LIMIT %s"
+    params.append(limit)
+    return query, params
+
+def applicant_from_row(r):
+    return dict(zip(APPLICANT_FIELDS, r))
+
+def applicants_version():
+    cur = get_db().cursor()
+    cur.execute("SELECT version FROM applicants_version")
+    version = cur.fetchone()[0]
+    cur.close()
+    return version
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def api_admin():
+    # Tools send an admin link token from the bot as a bearer token; the panel's own pages use the session
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        claims = validate_token(auth[len("Bearer "):].strip())
+        return claims[0] if claims else None
+    return current_admin()
+
+def api_error(message, status):
+    return jsonify(error=message), status
+
+def cached_json(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.after_request
+def compress_api_response(response):
+    if not request.path.startswith("/api/") or response.status_code != 200 or response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES or "Content-Encoding" in response.headers:
+        return response
+
+    if brotli is not None and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+    # Every encoding of the same content shares one weak ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def redirect_back():
+    # Back to the page the form was sent from, with its filter and position
+    target = request.form.get("next", "")
+    return redirect(target if target.startswith("/admin") else "/admin")
+
+ROW_TEMPLATE = """
+<tr id="applicant-{{ user.telegram_id }}" data-id="{{ user.id }}">
+  <td><input type="checkbox" name="telegram_id" value="{{ user.telegram_id }}" form="bulk-form" class="bulk-select"></td>
+  <td>{{ user.name }}</td>
+  <td>{{ user.age }}</td>
+  <td>{{ user.city }}</td>
+  <td>{{ user.phone or "—" }}</td>
+  <td>
+    {% if user.username %}
+      <a href="https://t.me/{{ user.username }}" target="_blank">@{{ user.username }}</a>
+    {% else %} — {% endif %}
+  </td>
+  <td class="status-{{ user.status.replace(' ', '') }}">{{ user.status }}</td>
+  <td>{{ user.accepted_city or "—" }}</td>
+  <td>{{ user.accepted_date or "—" }}</td>
+  <td>
+    <form method="post" action="/update" class="inline">
+      <input type="hidden" name="telegram_id" value="{{ user.telegram_id }}">
+      <input type="hidden" name="next" value="{{ current_url }}">
+      <select name="status" onchange="onStatusChange(this, '{{ user.telegram_id }}')">
+        <option value="New" {% if user.status == "New" %}selected{% endif %}>New</option>
+        <option value="In Progress" {% if user.status == "In Progress" %}selected{% endif %}>In Progress</option>
+        <option value="Accepted" {% if user.status == "Accepted" %}selected{% endif %}>Accepted</option>
+        <option value="Declined" {% if user.status == "Declined" %}selected{% endif %}>Declined</option>
+      </select>
+      <div id="extra-{{ user.telegram_id }}" class="extra-fields"{% if user.status == "Accepted" %} style="display: block"{% endif %}>
+        <input type="text" name="accepted_city" placeholder="Місто" value="{{ user.accepted_city or '' }}">
+        <input type="date" name="accepted_date" value="{{ user.accepted_date or '' }}">
+      </div>
+      <button type="submit">💾</button>
+    </form>
+  </td>
+  {% if is_admin %}
+  <td>
+    <form method="post" action="/delete" class="inline">
+      <input type="hidden" name="telegram_id" value="{{ user.telegram_id }}">
+      <input type="hidden" name="next" value="{{ current_url }}">
+      <button type="submit">🗑️</button>
+    </form>
+  </td>
+  {% endif %}
+</tr>
+"""
 
 TEMPLATE = """
 <!doctype html>
@@ -58,6 +603,7 @@ TEMPLATE = """
     .status-Declined { color: red; }
     form.inline { display: inline; }
     .extra-fields { display: none; }
+    #bulk-form { margin: 10px 0; }
   </style>
 </head>
 <body>
@@ -65,191 +611,363 @@ TEMPLATE = """
 
 <div>
   <b>🔎 Фільтр:</b>
-  {% for s in ['New', 'In Progress', 'Accepted', 'Declined'] %}
-    <a href="/admin?token={{ request.args.get('token') }}&status={{ s }}">
+  {% for s in statuses %}
+    <a href="/admin?status={{ s }}&per_page={{ per_page }}">
       <button>{{ s }}</button>
     </a>
   {% endfor %}
-  <a href="/admin?token={{ request.args.get('token') }}">
+  <a href="/admin?per_page={{ per_page }}">
     <button>🔁 Всі</button>
   </a>
+  <form method="post" action="/logout" class="inline">
+    <button type="submit">🚪 Вийти</button>
+  </form>
 </div>
 
-<table border="1" cellpadding="5">
+<form method="post" action="/bulk" id="bulk-form">
+  <b>☑️ Вибрані:</b>
+  <input type="hidden" name="next" value="{{ current_url }}">
+  <select name="action" onchange="document.getElementById('bulk-extra').style.display = this.value === 'Accepted' ? 'inline' : 'none'">
+    {% for s in statuses %}
+      <option value="{{ s }}">{{ s }}</option>
+    {% endfor %}
+    {% if is_admin %}<option value="delete">🗑️ Видалити</option>{% endif %}
+  </select>
+  <span id="bulk-extra" class="extra-fields">
+    <input type="text" name="accepted_city" placeholder="Місто">
+    <input type="date" name="accepted_date">
+  </span>
+  <button type="submit" onclick="return confirmBulk()">💾 Застосувати</button>
+</form>
+
+<details>
+  <summary><b>📣 Розсилка</b></summary>
+  <form method="post" action="/broadcast" onsubmit="return confirm('Надіслати повідомлення всім вибраним заявникам?')">
+    <input type="hidden" name="next" value="{{ current_url }}">
+    <select name="status">
+      <option value="">Всі статуси</option>
+      {% for s in statuses %}
+        <option value="{{ s }}" {% if s == status_filter %}selected{% endif %}>{{ s }}</option>
+      {% endfor %}
+    </select>
+    <input type="text" name="city" placeholder="Місто (необов'язково)">
+    <br>
+    <textarea name="text" rows="4" cols="60" maxlength="{{ broadcast_max_length }}" required
+      placeholder="Текст; {name}, {city}, {accepted_city} і {accepted_date} буде замінено даними заявника"></textarea>
+    <br>
+    <button type="submit">📣 Надіслати</button>
+  </form>
+</details>
+
+<div id="stale-notice" style="display: none">🔄 Зв'язок з базою відновлено, оновіть сторінку, щоб побачити всі зміни.</div>
+
+<table border="1" cellpadding="5" id="applicants">
   <tr>
+    <th><input type="checkbox" onclick="toggleAll(this)"></th>
     <th>Ім'я</th><th>Вік</th><th>Місто</th><th>Телефон</th><th>Username</th>
     <th>Статус</th><th>Прийнято: Місто</th><th>Прийнято: Дата</th><th>Оновити</th>{% if is_admin %}<th>Видалити</th>{% endif %}
   </tr>
+  {% set page = namespace(last_id=None, count=0) %}
   {% for user in users %}
-  <tr>
-    <td>{{ user.name }}</td>
-    <td>{{ user.age }}</td>
-    <td>{{ user.city }}</td>
-    <td>{{ user.phone or "—" }}</td>
-    <td>
-      {% if user.username %}
-        <a href="https://t.me/{{ user.username }}" target="_blank">@{{ user.username }}</a>
-      {% else %} — {% endif %}
-    </td>
-    <td class="status-{{ user.status.replace(' ', '') }}">{{ user.status }}</td>
-    <td>{{ user.accepted_city or "—" }}</td>
-    <td>{{ user.accepted_date or "—" }}</td>
-    <td>
-      <form method="post" action="/update" class="inline">
-        <input type="hidden" name="telegram_id" value="{{ user.telegram_id }}">
-        <input type="hidden" name="token" value="{{ request.args.get('token') }}">
-        <select name="status" onchange="onStatusChange(this, '{{ user.telegram_id }}')">
-          <option value="New" {% if user.status == "New" %}selected{% endif %}>New</option>
-          <option value="In Progress" {% if user.status == "In Progress" %}selected{% endif %}>In Progress</option>
-          <option value="Accepted" {% if user.status == "Accepted" %}selected{% endif %}>Accepted</option>
-          <option value="Declined" {% if user.status == "Declined" %}selected{% endif %}>Declined</option>
-        </select>
-        <div id="extra-{{ user.telegram_id }}" class="extra-fields">
-          <input type="text" name="accepted_city" placeholder="Місто" value="{{ user.accepted_city or '' }}">
-          <input type="date" name="accepted_date" value="{{ user.accepted_date or '' }}">
-        </div>
-        <button type="submit">💾</button>
-      </form>
-    </td>
-    {% if is_admin %}
-    <td>
-      <form method="post" action="/delete" class="inline">
-        <input type="hidden" name="telegram_id" value="{{ user.telegram_id }}">
-        <input type="hidden" name="token" value="{{ request.args.get('token') }}">
-        <button type="submit">🗑️</button>
-      </form>
-    </td>
-    {% endif %}
-  </tr>
+  {% set page.last_id = user.id %}
+  {% set page.count = page.count + 1 %}
+  {{ render_row(user) }}
   {% endfor %}
 </table>
 
+<div>
+  {% if before %}
+    <a href="/admin?{% if status_filter %}status={{ status_filter|urlencode }}&{% endif %}per_page={{ per_page }}"><button>⏮️ На початок</button></a>
+  {% endif %}
+  {% if page.count == per_page %}
+    <a href="/admin?{% if status_filter %}status={{ status_filter|urlencode }}&{% endif %}per_page={{ per_page }}&before={{ page.last_id }}"><button>Далі ▶️</button></a>
+  {% endif %}
+</div>
+
 <script>
+function toggleAll(box) {
+  document.querySelectorAll('.bulk-select').forEach(function(c) { c.checked = box.checked; });
+}
+
+function confirmBulk() {
+  const count = document.querySelectorAll('.bulk-select:checked').length;
+  if (count === 0) { alert("Нічого не вибрано"); return false; }
+  const action = document.querySelector('#bulk-form select[name="action"]').value;
+  return action !== "delete" || confirm("Видалити " + count + " заявок?");
+}
+
 function onStatusChange(select, id) {
   const showExtra = select.value === "Accepted";
   document.getElementById("extra-" + id).style.display = showExtra ? "block" : "none";
 }
 
-// Show extra fields for accepted applications on page load
-document.addEventListener('DOMContentLoaded', function() {
-  const selects = document.querySelectorAll('select[name="status"]');
-  selects.forEach(function(select) {
-    if (select.value === "Accepted") {
-      const id = select.closest('form').querySelector('input[name="telegram_id"]').value;
-      document.getElementById("extra-" + id).style.display = "block";
-    }
-  });
-});
+// Rows added or changed elsewhere (the bot, other admins) arrive as server-sent events
+const statusFilter = {{ status_filter|tojson }};
+const firstPage = {{ 'false' if before else 'true' }};
+const perPage = {{ per_page }};
+const changes = new EventSource("/admin/events?next=" + encodeURIComponent({{ current_url|tojson }}));
+changes.onmessage = function(event) {
+  const change = JSON.parse(event.data);
+  if (change.op === "reload") {
+    document.getElementById("stale-notice").style.display = "block";
+    return;
+  }
+  const existing = document.getElementById("applicant-" + change.telegram_id);
+  if (change.op === "delete" || (statusFilter && change.status !== statusFilter)) {
+    if (existing) existing.remove();
+    return;
+  }
+  const template = document.createElement("template");
+  template.innerHTML = change.html.trim();
+  const row = template.content.firstChild;
+  if (existing) {
+    row.querySelector(".bulk-select").checked = existing.querySelector(".bulk-select").checked;
+    existing.replaceWith(row);
+    return;
+  }
+  // Keep the id order; a row below the last one shown belongs to a later page
+  const rows = Array.from(document.querySelectorAll("tr[data-id]"));
+  const next = rows.find(function(r) { return Number(r.dataset.id) < change.id; });
+  if (next && (firstPage || rows[0] !== next)) {
+    next.before(row);
+  } else if (!next && rows.length < perPage) {
+    document.getElementById("applicants").appendChild(row);
+  }
+};
 </script>
 </body>
 </html>
 """
 
+# Compiled once; a template change also changes every ETag
+page_template = app.jinja_env.from_string(TEMPLATE)
+row_template = app.jinja_env.from_string(ROW_TEMPLATE)
+TEMPLATE_DIGEST = hashlib.sha256((TEMPLATE + ROW_TEMPLATE).encode()).hexdigest()[:16]
+
 @app.route("/admin")
 def index():
     token = request.args.get("token")
-    logger.info(f"Admin panel access attempt with token: {token[:8]}...")
-    
-    telegram_id = validate_token(token)
+    if token:
+        logger.info(f"Admin panel access attempt with token: {token[:8]}...")
+        claims = validate_token(token)
+        if not claims:
+            logger.warning(f"Access denied: Invalid token {token[:8]}...")
+            return abort(403)
+
+        # Exchange the link token for a session and drop it from the URL
+        start_admin_session(*claims)
+        args = request.args.to_dict()
+        args.pop("token")
+        return redirect(url_for("index", **args))
+
+    telegram_id = current_admin()
     if not telegram_id:
-        logger.warning(f"Access denied: Invalid token {token[:8]}...")
+        logger.warning("Access denied: No valid admin session")
         return abort(403)
         
     logger.info(f"Admin panel access granted to user {telegram_id}")
     status_filter = request.args.get("status")
     logger.info(f"Status filter applied: {status_filter}")
-    
-    conn = psycopg2.connect(DB_URL)
-    cur = conn.cursor()
 
-    query = """
-        SELECT name, age, city, phone, username, telegram_id, status, 
-               accepted_city, accepted_date::text
-        FROM applicants
-    """
-    params = []
+    per_page = min(max(request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    before = request.args.get("before", type=int)
 
-    if status_filter:
-        query += " WHERE status = %s"
-        params.append(status_filter)
+    # Read before the rows, so a change made in between only makes the ETag older
+    version = applicants_version()
+    etag = page_etag(version, telegram_id == ADMIN_ID)
+    if request.if_none_match.contains(etag):
+        logger.info(f"Applications unchanged (version {version}), answering 304")
+        return not_modified(etag)
 
-    query += " ORDER BY id DESC"
-    cur.execute(query, params)
+    query, params = applicants_query(status_filter, before, per_page)
 
-    rows = cur.fetchall()
-    users = [dict(
-        name=r[0], age=r[1], city=r[2], phone=r[3], username=r[4],
-        telegram_id=r[5], status=r[6], accepted_city=r[7], accepted_date=r[8]
-    ) for r in rows]
-    
-    logger.info(f"Retrieved {len(users)} applications for user {telegram_id}")
-    
+    def stream_users():
+        # A named cursor keeps the rows on the server and hands them over in batches of itersize
+        cur = get_db().cursor(name="admin_applicants")
+        cur.itersize = 200
+        count = 0
+        try:
+            cur.execute(query, params)
+            for r in cur:
+                count += 1
+                yield applicant_from_row(r)
+        finally:
+            cur.close()
+            logger.info(f"Streamed {count} applications to user {telegram_id}")
+
+    response = Response(stream_template(
+        page_template,
+        users=stream_users(),
+        render_row=row_renderer(telegram_id == ADMIN_ID, request.full_path),
+        is_admin=telegram_id == ADMIN_ID,
+        statuses=STATUSES,
+        current_url=request.full_path,
+        status_filter=status_filter,
+        per_page=per_page,
+        before=before,
+        broadcast_max_length=BROADCAST_MAX_LENGTH
+    ))
+    response.set_etag(etag)
+    # Browsers check back every time and get a 304 while nothing changed
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route("/admin/events")
+def admin_events():
+    telegram_id = current_admin()
+    if not telegram_id:
+        return abort(403)
+
+    sid = session.get("sid")
+    expires_at = session.get("expires_at", 0)
+    next_url = request.args.get("next", "")
+    render_row = row_renderer(telegram_id == ADMIN_ID, next_url if next_url.startswith("/admin") else "/admin")
+    changes = subscribe_changes()
+    logger.info(f"Live updates opened for user {telegram_id}")
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            # Only the revocation check on keepalives touches the database, so an open stream does not hold a pooled connection
+            while time.time() < expires_at and sid not in revoked_sids:
+                try:
+                    payload = changes.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    if session_revoked(sid):
+                        logger.info(f"Live updates ended for user {telegram_id}: session revoked")
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    yield f"data: {json.dumps({'op': 'reload'})}\n\n"
+                    break
+
+                change = json.loads(payload)
+                if change["op"] == "upsert":
+                    row = change["row"]
+                    change = {
+                        "op": "upsert", "id": row["id"], "telegram_id": row["telegram_id"],
+                        "status": row["status"], "html": render_row(row)
+                    }
+                yield f"data: {json.dumps(change)}\n\n"
+        finally:
+            unsubscribe_changes(changes)
+            logger.info(f"Live updates closed for user {telegram_id}")
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/applicants")
+def api_list_applicants():
+    telegram_id = api_admin()
+    if not telegram_id:
+        return api_error("forbidden", 403)
+
+    status_filter = request.args.get("status")
+    if status_filter and status_filter not in STATUSES:
+        return api_error(f"status must be one of {', '.join(STATUSES)}", 400)
+    limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    # The cursor is the id the previous page ended at
+    cursor = request.args.get("cursor")
+    if cursor and not cursor.isdigit():
+        return api_error("invalid cursor", 400)
+
+    etag = page_etag(applicants_version(), telegram_id == ADMIN_ID)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    cur = get_db().cursor()
+    cur.execute(*applicants_query(status_filter, int(cursor) if cursor else None, limit))
+    applicants = [applicant_from_row(r) for r in cur.fetchall()]
     cur.close()
-    conn.close()
-    return render_template_string(TEMPLATE, users=users, is_admin=telegram_id == ADMIN_ID)
+
+    next_cursor = str(applicants[-1]["id"]) if len(applicants) == limit else None
+    logger.info(f"API listed {len(applicants)} applications for user {telegram_id}")
+    return cached_json({"applicants": applicants, "next_cursor": next_cursor}, etag)
+
+@app.route("/api/applicants/<int:applicant_id>")
+def api_get_applicant(applicant_id):
+    telegram_id = api_admin()
+    if not telegram_id:
+        return api_error("forbidden", 403)
+
+    etag = page_etag(applicants_version(), telegram_id == ADMIN_ID)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    cur = get_db().cursor()
+    cur.execute(APPLICANT_SELECT + " WHERE telegram_id = %s", (applicant_id,))
+    row = cur.fetchone()
+    cur.close()
+    if row is None:
+        return api_error("applicant not found", 404)
+    return cached_json(applicant_from_row(row), etag)
+
+@app.route("/api/applicants/<int:applicant_id>", methods=["PATCH"])
+def api_update_applicant(applicant_id):
+    telegram_id = api_admin()
+    if not telegram_id:
+        return api_error("forbidden", 403)
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or body.get("status") not in STATUSES:
+        return api_error(f"status must be one of {', '.join(STATUSES)}", 400)
+    accepted_date = body.get("accepted_date")
+    if accepted_date:
+        try:
+            date.fromisoformat(accepted_date)
+        except (TypeError, ValueError):
+            return api_error("accepted_date must be YYYY-MM-DD", 400)
+
+    logger.info(f"API: user {telegram_id} updating applicant {applicant_id} to status '{body['status']}'")
+    conn = get_db()
+    cur = conn.cursor()
+    set_applicant_status(cur, [applicant_id], body["status"], body.get("accepted_city"), accepted_date)
+    cur.execute(APPLICANT_SELECT + " WHERE telegram_id = %s", (applicant_id,))
+    row = cur.fetchone()
+    if row is None:
+        conn.rollback()
+        cur.close()
+        return api_error("applicant not found", 404)
+    conn.commit()
+    cur.close()
+    return jsonify(applicant_from_row(row))
 
 @app.route("/update", methods=["POST"])
 def update_status():
-    token = request.form.get("token")
-    logger.info(f"Status update attempt with token: {token[:8] if token else 'None'}...")
-    
-    telegram_id = validate_token(token)
+    telegram_id = current_admin()
+    logger.info(f"Status update attempt by user {telegram_id}")
     if not telegram_id:
-        logger.warning(f"Update denied: Invalid token {token[:8] if token else 'None'}...")
+        logger.warning("Update denied: No valid admin session")
         return abort(403)
           
     applicant_id = request.form["telegram_id"]
     new_status = request.form["status"]
     accepted_city = request.form.get("accepted_city")
     accepted_date = request.form.get("accepted_date")
+    if new_status not in STATUSES:
+        return abort(400)
     
     logger.info(f"User {telegram_id} updating applicant {applicant_id} to status '{new_status}'")
     if new_status == "Accepted":
         logger.info(f"Accepted details - City: {accepted_city}, Date: {accepted_date}")
 
-    conn = psycopg2.connect(DB_URL)
+    conn = get_db()
     cur = conn.cursor()
-
-    if new_status == "Accepted" and accepted_city and accepted_date:
-        cur.execute("""
-            UPDATE applicants
-            SET status = %s, accepted_city = %s, accepted_date = %s
-            WHERE telegram_id = %s
-        """, (new_status, accepted_city, accepted_date, applicant_id))
-    else:
-        cur.execute("UPDATE applicants SET status = %s WHERE telegram_id = %s", (new_status, applicant_id))
-
-    if new_status in ("Accepted", "Declined"):
-        cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-        topic = cur.fetchone()
-        if topic:
-            logger.info(f"Attempting to delete forum topic for applicant {applicant_id}, thread_id: {topic[0]}")
-            bot = telegram.Bot(token=BOT_TOKEN)
-            try:
-                bot.delete_forum_topic(chat_id=GROUP_ID, message_thread_id=topic[0])
-                logger.info(f"Forum topic deleted successfully")
-            except Exception as e:
-                logger.error(f"Error deleting forum topic: {str(e)}")
-            
-            cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-            logger.info(f"Topic mapping deleted from database")
-
+    set_applicant_status(cur, [int(applicant_id)], new_status, accepted_city, accepted_date)
     conn.commit()
     cur.close()
-    conn.close()
     
     logger.info(f"Status update completed successfully")
-    return redirect(f"/admin?token={token}")
+    return redirect_back()
 
 @app.route("/delete", methods=["POST"])
 def delete_user():
-    token = request.form.get("token")
-    logger.info(f"Delete user attempt with token: {token[:8] if token else 'None'}...")
-    
-    telegram_id = validate_token(token)
-    
+    telegram_id = current_admin()
+    logger.info(f"Delete user attempt by user {telegram_id}")
+
     if not telegram_id:
-        logger.warning(f"Delete denied: Invalid token {token[:8] if token else 'None'}...")
+        logger.warning("Delete denied: No valid admin session")
         return abort(403)
         
     if telegram_id != ADMIN_ID:
@@ -259,32 +977,105 @@ def delete_user():
     applicant_id = request.form["telegram_id"]
     logger.info(f"Admin {telegram_id} deleting applicant {applicant_id}")
 
-    conn = psycopg2.connect(DB_URL)
+    conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-    topic = cur.fetchone()
+    delete_applicants(cur, [int(applicant_id)])
+    conn.commit()
+    cur.close()
 
-    if topic:
-        logger.info(f"Attempting to delete forum topic for applicant {applicant_id}, thread_id: {topic[0]}")
-        bot = telegram.Bot(token=BOT_TOKEN)
-        try:
-            bot.delete_forum_topic(chat_id=GROUP_ID, message_thread_id=topic[0])
-            logger.info(f"Forum topic deleted successfully")
-        except Exception as e:
-            logger.error(f"Error deleting forum topic: {str(e)}")
-            
-        cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-        logger.info(f"Topic mapping deleted from database")
+    logger.info(f"Delete operation completed successfully")
+    return redirect_back()
+
+@app.route("/bulk", methods=["POST"])
+def bulk_action():
+    telegram_id = current_admin()
+    if not telegram_id:
+        logger.warning("Bulk action denied: No valid admin session")
+        return abort(403)
+
+    action = request.form.get("action", "")
+    try:
+        applicant_ids = sorted({int(i) for i in request.form.getlist("telegram_id")})
+    except ValueError:
+        return abort(400)
+    if not applicant_ids:
+        return redirect_back()
+
+    if action == "delete":
+        if telegram_id != ADMIN_ID:
+            logger.warning(f"Bulk delete denied: User {telegram_id} is not the admin (ADMIN_ID: {ADMIN_ID})")
+            return abort(403)
+    elif action not in STATUSES:
+        return abort(400)
 
-    cur.execute("DELETE FROM applicants WHERE telegram_id = %s", (applicant_id,))
-    logger.info(f"Applicant record deleted from database")
+    logger.info(f"User {telegram_id} applying '{action}' to {len(applicant_ids)} applicants")
+    conn = get_db()
+    cur = conn.cursor()
+    # All rows change in one transaction, or none do
+    if action == "delete":
+        changed = delete_applicants(cur, applicant_ids)
+    else:
+        changed = set_applicant_status(
+            cur, applicant_ids, action, request.form.get("accepted_city"), request.form.get("accepted_date")
+        )
     conn.commit()
     cur.close()
-    conn.close()
 
-    logger.info(f"Delete operation completed successfully")
-    return redirect(f"/admin?token={token}")
+    logger.info(f"Bulk '{action}' completed for {changed} applicants")
+    return redirect_back()
+
+@app.route("/broadcast", methods=["POST"])
+def broadcast():
+    telegram_id = current_admin()
+    if not telegram_id:
+        logger.warning("Broadcast denied: No valid admin session")
+        return abort(403)
+
+    text = request.form.get("text", "").strip()
+    status = request.form.get("status") or None
+    city = request.form.get("city", "").strip() or None
+    if not text or len(text) > BROADCAST_MAX_LENGTH or (status and status not in STATUSES):
+        return abort(400)
+
+    conn = get_db()
+    cur = conn.cursor()
+    broadcast_id, total = create_broadcast(cur, text, status, city, telegram_id)
+    conn.commit()
+    cur.close()
+
+    logger.info(f"User {telegram_id} created broadcast {broadcast_id} for {total} applicants (status={status}, city={city})")
+    target = request.form.get("next", "")
+    back = target if target.startswith("/admin") else "/admin"
+    return f'📣 Розсилку #{broadcast_id} створено: {total} отримувачів. <a href="{escape(back)}">Назад</a>'
+
+@app.route("/logout", methods=["POST"])
+def logout():
+    global revoked_sids
+    sid = session.get("sid")
+    if current_admin() and sid:
+        # Revoke the session (and the link it came from) until it would have expired anyway
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO revoked_admin_sessions (sid, expires_at)
+            VALUES (%s, to_timestamp(%s))
+            ON CONFLICT (sid) DO NOTHING
+        """, (sid, session["expires_at"]))
+        cur.execute("DELETE FROM revoked_admin_sessions WHERE expires_at < now()")
+        conn.commit()
+        cur.close()
+        revoked_sids = revoked_sids | {sid}
+        logger.info(f"Admin session revoked for user {session.get('admin_id')}")
+
+    session.clear()
+    return "🚪 Ви вийшли з панелі адміністратора."
+
+LIVE_CLIENTS.set_function(lambda: len(change_subscribers))
 
 if __name__ == '__main__':
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT, addr=METRICS_ADDR)
+        logger.info(f"Metrics served on {METRICS_ADDR}:{METRICS_PORT}")
+    wait_for_schema()
     logger.info("Starting Flask application")
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,249 @@
+"""Measures admin panel latency under concurrent clients on a large seeded dataset.
+
+Seeds --applicants applicants across all statuses, with topic mappings and
+admin tokens, then serves app.py from a threaded server in this process and
+runs each scenario with --concurrency clients: /admin unfiltered, filtered
+by status, and revalidated with If-None-Match, then /update and /delete.
+Reports requests per second, latency percentiles, response sizes and the
+database statements each request ran.
+
+    DATABASE_URL=postgresql://localhost/bench python load_benchmark.py --applicants 100000 --concurrency 16
+
+The schema has to exist already; start the bot against the database once.
+Seeded rows use their own telegram_id range, are replaced on every run and
+deleted afterwards unless --keep-data is given. The benchmark writes to
+applicants and the counters built from them, so it refuses to run unless
+the database name contains "bench"; --any-database overrides that.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import statistics
+import threading
+import http.client
+from urllib.parse import urlencode
+
+# app.py reads its settings on import
+os.environ.setdefault("ADMIN_ID", "4242")
+os.environ.setdefault("ADMIN_TOKEN_SECRET", "benchmark")
+os.environ.setdefault("SESSION_COOKIE_SECURE", "0")
+
+import psycopg2
+from werkzeug.serving import make_server
+import app as panel
+
+SEED_BASE = 7000000000000  # telegram_id of seeded applicant i is SEED_BASE + i
+THREAD_BASE = 900000000
+CITIES = ["Київ", "Львів", "Одеса", "Дніпро", "Харків", "Вінниця", "Полтава", "Запоріжжя"]
+
+
+def seed(conn, count):
+    cleanup(conn)
+    cur = conn.cursor()
+    started = time.perf_counter()
+    # 40% New, 20% each of the other statuses, spread evenly over the id range
+    cur.execute("""
+        INSERT INTO applicants (name, age, city, telegram_id, username, phone, status, accepted_city, accepted_date)
+        SELECT 'Applicant ' || i, 18 + i %% 40, (%s::text[])[1 + i %% array_length(%s::text[], 1)],
+               %s + i, 'user' || i, '+38093' || lpad((i %% 10000000)::text, 7, '0'),
+               (ARRAY['New', 'New', 'New', 'New', 'In Progress', 'In Progress', 'Accepted', 'Accepted', 'Declined', 'Declined'])[1 + i %% 10],
+               CASE WHEN i %% 10 IN (6, 7) THEN 'Київ' END,
+               CASE WHEN i %% 10 IN (6, 7) THEN DATE '2025-01-01' + i %% 365 END
+        FROM generate_series(1, %s) AS i
+    """, (CITIES, CITIES, SEED_BASE, count))
+    # Topics exist for applicants still being talked to
+    cur.execute("""
+        INSERT INTO topic_mappings (telegram_id, thread_id)
+        SELECT telegram_id, %s + (telegram_id - %s) FROM applicants
+        WHERE telegram_id > %s AND telegram_id <= %s AND status IN ('New', 'In Progress')
+    """, (THREAD_BASE, SEED_BASE, SEED_BASE, SEED_BASE + count))
+    cur.execute("""
+        INSERT INTO admin_tokens (token, telegram_id)
+        SELECT md5(i::text), %s + i FROM generate_series(1, %s, 10) AS i
+    """, (SEED_BASE, count))
+    conn.commit()
+    cur.execute("ANALYZE applicants")
+    cur.execute("ANALYZE topic_mappings")
+    cur.execute("ANALYZE admin_tokens")
+    conn.commit()
+    cur.close()
+    print(f"🌱 Seeded {count} applicants in {time.perf_counter() - started:.1f}s")
+
+
+def cleanup(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM topic_mappings WHERE telegram_id > %s", (SEED_BASE,))
+    cur.execute("DELETE FROM admin_tokens WHERE telegram_id > %s", (SEED_BASE,))
+    cur.execute("DELETE FROM applicants WHERE telegram_id > %s", (SEED_BASE,))
+    # Forum topic deletions the panel queued for seeded topics, which never existed
+    cur.execute("""
+        DELETE FROM bot_outbox
+        WHERE action = 'delete_forum_topic' AND (payload->>'thread_id')::bigint >= %s
+    """, (THREAD_BASE,))
+    conn.commit()
+    cur.close()
+
+
+def session_cookie(port):
+    nonce = f"bench{random.getrandbits(32)}"
+    payload = f"{panel.ADMIN_ID}.{int(time.time()) + 3600}.{nonce}"
+    token = f"{payload}.{panel.sign_admin_payload(payload)}"
+    status, headers, _ = request(port, "GET", "/admin?" + urlencode({"token": token}))
+    if status != 302:
+        sys.exit(f"❌ Could not log in to the panel: HTTP {status}")
+    return headers["Set-Cookie"].split(";", 1)[0]
+
+
+def request(port, method, path, headers=None, form=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        headers = dict(headers or {})
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, response.headers, data
+    finally:
+        conn.close()
+
+
+def statements_run():
+    return sum(
+        sample.value
+        for metric in panel.DB_QUERY_DURATION.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_count")
+    )
+
+
+def run_scenario(port, name, requests_total, concurrency, make_request, expected):
+    latencies = []
+    sizes = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests_total))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, path, headers, form = make_request(i)
+            started = time.perf_counter()
+            try:
+                status, _, body = request(port, method, path, headers, form)
+            except Exception as e:
+                status, body = str(e), b""
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == expected:
+                    latencies.append(elapsed)
+                    sizes.append(len(body))
+                else:
+                    errors.append(status)
+
+    statements_before = statements_run()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    statements = statements_run() - statements_before
+
+    if not latencies:
+        print(f"{name:<16} all {requests_total} requests failed: {errors[:3]}")
+        return
+    values = sorted(latencies)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    print(f"{name:<16} {len(values) / elapsed:7.1f} req/s  p50={pick(0.5):7.1f}ms p95={pick(0.95):7.1f}ms "
+          f"p99={pick(0.99):7.1f}ms max={values[-1] * 1000:7.1f}ms  size={statistics.mean(sizes) / 1024:7.1f}KiB  "
+          f"queries={statements / requests_total:4.1f}/req")
+    if errors:
+        print(f"{'':<16} ⚠️ {len(errors)} unexpected responses, e.g. {errors[:3]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending requests at once")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--per-page", type=int, default=panel.DEFAULT_PAGE_SIZE)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the applicants seeded by an earlier --keep-data run")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--any-database", action="store_true", help="run even if the database name does not contain \"bench\"")
+    args = parser.parse_args()
+    if not panel.DB_URL:
+        parser.error("DATABASE_URL is required")
+
+    # Per-request log lines would dominate the measurement
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    conn = psycopg2.connect(panel.DB_URL)
+    cur = conn.cursor()
+    cur.execute("SELECT current_database()")
+    database = cur.fetchone()[0]
+    if "bench" not in database and not args.any_database:
+        sys.exit(f"❌ Refusing to seed {database}; point DATABASE_URL at a dedicated benchmark database or pass --any-database")
+    cur.execute("SELECT to_regclass('applicants') IS NOT NULL AND to_regclass('applicants_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        sys.exit("❌ The schema is missing; start the bot against this database once first")
+    cur.close()
+    if not args.skip_seed:
+        seed(conn, args.applicants)
+
+    server = make_server("127.0.0.1", 0, panel.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    cookie = {"Cookie": session_cookie(port)}
+    status, headers, _ = request(port, "GET", f"/admin?per_page={args.per_page}", cookie)
+    etag = headers.get("ETag")
+    cur = conn.cursor()
+    cur.execute("SELECT min(id), max(id) FROM applicants WHERE telegram_id > %s", (SEED_BASE,))
+    first_id, last_id = cur.fetchone()
+    cur.close()
+    print(f"🏃 {args.requests} requests per scenario, {args.concurrency} clients, {args.per_page} rows per page\n")
+
+    # Distinct applicants per write, so every /delete removes a row
+    rng = random.Random(42)
+    targets = rng.sample(range(1, args.applicants + 1), min(args.applicants, args.requests * 2))
+    update_targets = targets[:args.requests]
+    delete_targets = targets[args.requests:]
+
+    try:
+        run_scenario(port, "admin", args.requests, args.concurrency,
+                     lambda i: ("GET", f"/admin?per_page={args.per_page}", cookie, None), 200)
+        run_scenario(port, "admin filtered", args.requests, args.concurrency,
+                     lambda i: ("GET", f"/admin?per_page={args.per_page}&" + urlencode({"status": panel.STATUSES[i % len(panel.STATUSES)]}), cookie, None), 200)
+        run_scenario(port, "admin deep page", args.requests, args.concurrency,
+                     lambda i: ("GET", f"/admin?per_page={args.per_page}&before={rng.randint(first_id, last_id)}", cookie, None), 200)
+        if etag:
+            run_scenario(port, "admin 304", args.requests, args.concurrency,
+                         lambda i: ("GET", f"/admin?per_page={args.per_page}", dict(cookie, **{"If-None-Match": etag}), None), 304)
+        run_scenario(port, "update", len(update_targets), args.concurrency,
+                     lambda i: ("POST", "/update", cookie, {
+                         "telegram_id": SEED_BASE + update_targets[i],
+                         "status": panel.STATUSES[i % len(panel.STATUSES)],
+                         "accepted_city": "Київ", "accepted_date": "2025-06-01",
+                     }), 302)
+        if delete_targets:
+            run_scenario(port, "delete", len(delete_targets), args.concurrency,
+                         lambda i: ("POST", "/delete", cookie, {"telegram_id": SEED_BASE + delete_targets[i]}), 302)
+    finally:
+        server.shutdown()
+        if not args.keep_data:
+            cleanup(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram albums hold at most 10 items
+MAX_ALBUM_SIZE = 10
+
+
+class _Album:
+    def __init__(self, relay, deadline):
+        self.relay = relay
+        self.messages = []
+        self.deadline = deadline
+        self.complete = asyncio.Event()
+        self.task = None
+
+
+class AlbumBuffer:
+    """Collects the messages of a media group so they can be relayed in one call.
+
+    Album items arrive as separate updates a few milliseconds apart. Each one
+    extends the collection window; once it passes, or the album is full,
+    relay(messages) gets all of them ordered by message id. flush(chat_key)
+    relays a chat's albums right away, so a message sent after an album is
+    never relayed before it.
+    """
+
+    def __init__(self, window=0.5):
+        self.window = window
+        self._albums = {}  # (chat_key, media_group_id) -> _Album still collecting
+        self._sending = set()  # (chat_key, task) for albums being relayed
+
+    def __len__(self):
+        return sum(len(album.messages) for album in self._albums.values())
+
+    def add(self, chat_key, message, relay):
+        loop = asyncio.get_running_loop()
+        key = (chat_key, message.media_group_id)
+        album = self._albums.get(key)
+        if album is None:
+            album = self._albums[key] = _Album(relay, 0)
+            album.task = asyncio.create_task(self._deliver(key, album))
+        album.messages.append(message)
+        album.deadline = loop.time() + self.window
+        if len(album.messages) >= MAX_ALBUM_SIZE:
+            album.complete.set()
+
+    async def flush(self, chat_key):
+        tasks = []
+        for (album_chat, _), album in list(self._albums.items()):
+            if album_chat == chat_key:
+                album.complete.set()
+                tasks.append(album.task)
+        tasks.extend(task for sending_chat, task in list(self._sending) if sending_chat == chat_key)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self):
+        for album in self._albums.values():
+            album.complete.set()
+        tasks = [album.task for album in self._albums.values()] + [task for _, task in self._sending]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _deliver(self, key, album):
+        loop = asyncio.get_running_loop()
+        while not album.complete.is_set():
+            remaining = album.deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(album.complete.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+        # Items arriving from now on start a new album
+        del self._albums[key]
+        entry = (key[0], asyncio.current_task())
+        self._sending.add(entry)
+        try:
+            await album.relay(sorted(album.messages, key=lambda m: m.message_id))
+        except Exception as e:
+            logger.error(f"❌ Failed to relay album {key[1]}: {str(e)}")
+        finally:
+            self._sending.discard(entry)
@@ -5,13 +5,32 @@ from telegram import (
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, filters,
     ContextTypes, ConversationHandler, CallbackQueryHandler,
-    MessageReactionHandler
+    MessageReactionHandler, ChatMemberHandler
 )
 import os
-import psycopg2
+import time
+import hmac
+import base64
+import hashlib
+import asyncio
+import psycopg
+from psycopg_pool import AsyncConnectionPool
 import uuid
 import logging
+from functools import partial
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
+from caches import TopicMappingCache, LRUCache, TTLCache
+from write_behind import WriteBehindBuffer
+from update_processor import ChatOrderedUpdateProcessor, chat_order_key
+from send_scheduler import SendScheduler, PRIORITY_BULK
+from persistence import PostgresPersistence
+from outbox import OutboxConsumer
+from broadcast import BroadcastWorker, create_broadcast, MAX_TEXT_LENGTH
+from album_buffer import AlbumBuffer
+from migrations import migrate
+from prometheus_client import start_http_server
+from metrics import TimedAsyncCursor, DB_POOL_CONNECTIONS, QUEUE_SIZE, instrument_handlers
 
 # Configure logging
 logging.basicConfig(
@@ -26,106 +45,395 @@ ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 GROUP_ID = int(os.getenv("GROUP_ID", "0"))
 DB_URL = os.getenv("DATABASE_URL")
 APP_DOMAIN = os.getenv("APP_DOMAIN")
+# Shared with the admin panel, which verifies the links without a database lookup
+ADMIN_TOKEN_SECRET = os.getenv("ADMIN_TOKEN_SECRET")
+if not ADMIN_TOKEN_SECRET:
+    raise RuntimeError("ADMIN_TOKEN_SECRET is not set; the bot signs admin panel links with it")
+ADMIN_TOKEN_TTL_MINUTES = 10
+
+# Connection pool settings (acquire timeout is in seconds)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+TOPIC_CACHE_SIZE = int(os.getenv("TOPIC_CACHE_SIZE", "10000"))
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "5000"))
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+
+# message_log / message_reactions writes are batched: flushed at this many rows or every interval seconds
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "100"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+
+# Updates handled at once; updates of the same chat or applicant still run in order
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "8"))
+APPLICANT_CALLBACKS = ("start_chat", "delete_user", "set_status")
+
+# Outgoing message limits: per second overall and per private chat, per minute per group
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_PRIVATE_CHAT_RATE = float(os.getenv("SEND_PRIVATE_CHAT_RATE", "1"))
+SEND_GROUP_RATE_PER_MINUTE = float(os.getenv("SEND_GROUP_RATE_PER_MINUTE", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+
+# Webhook mode is used when WEBHOOK_URL (the public base URL of this worker) is set, polling otherwise
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or os.getenv("PORT") or "8443")
+# Telegram sends it back in X-Telegram-Bot-Api-Secret-Token; requests without it are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{TOKEN or ''}".encode()).hexdigest()
+# Alternative Bot API server, e.g. a local one or the fake server of webhook_probe.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Seconds between batched writes of conversation states and user_data
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+
+# Side effects queued by the admin panel in bot_outbox
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "10"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Broadcasts: messages sent per checkpoint, and how often to look for work without a notification
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "20"))
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", "30"))
+BROADCAST_STATUSES = ['New', 'In Progress', 'Accepted', 'Declined']
+
+# Seconds to wait for the next item of an album before relaying it with one copy_messages call
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "0.5"))
+
+# Prometheus metrics are served on this port when it is set
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
 
-pending_accepts = {}
 APPLICANTS_TOPIC_ID = None
+db_pool = None
+write_buffer = None
+outbox_consumer = None
+broadcast_worker = None
+topic_cache = TopicMappingCache(TOPIC_CACHE_SIZE)
+# (chat_id, message_id) -> (admin_message_id, user_message_id, telegram_id, thread_id)
+message_pair_cache = LRUCache(MESSAGE_CACHE_SIZE)
+# user_id -> chat member status in the admin group
+membership_cache = TTLCache(MEMBERSHIP_CACHE_TTL)
+album_buffer = AlbumBuffer(ALBUM_WINDOW)
+notification_listener = None
+
+async def warm_topic_cache():
+    topic_cache.begin_load()
+    async with db_pool.connection() as conn:
+        async with conn.cursor() as cur:
+            # One extra row tells us whether every mapping fits in the cache
+            await cur.execute(
+                "SELECT telegram_id, thread_id FROM topic_mappings ORDER BY id DESC LIMIT %s",
+                (TOPIC_CACHE_SIZE + 1,)
+            )
+            rows = await cur.fetchall()
+    topic_cache.load(reversed(rows))
+    logger.info(f"✅ Topic cache warmed with {len(topic_cache)} mappings (complete: {topic_cache.complete})")
+
+async def lookup_thread_id(telegram_id):
+    thread_id = topic_cache.get_thread_id(telegram_id)
+    if thread_id is not None or topic_cache.complete:
+        return thread_id
+
+    async with db_pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (telegram_id,))
+            result = await cur.fetchone()
+    if not result:
+        return None
+    topic_cache.put(telegram_id, result[0])
+    return result[0]
+
+async def lookup_applicant_id(thread_id):
+    telegram_id = topic_cache.get_applicant_id(thread_id)
+    if telegram_id is not None or topic_cache.complete:
+        return telegram_id
+
+    async with db_pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT telegram_id FROM topic_mappings WHERE thread_id = %s", (thread_id,))
+            result = await cur.fetchone()
+    if not result:
+        return None
+    topic_cache.put(result[0], thread_id)
+    return result[0]
+
+async def notify_applicant_changed(cur, telegram_id):
+    # Delivered on commit; open admin panels update the row in place
+    await cur.execute("""
+        SELECT pg_notify('applicant_changes', json_build_object('op', 'upsert', 'row', json_build_object(
+            'id', id, 'name', name, 'age', age, 'city', city, 'phone', phone, 'username', username,
+            'telegram_id', telegram_id, 'status', status,
+            'accepted_city', accepted_city, 'accepted_date', accepted_date::text
+        ))::text)
+        FROM applicants WHERE telegram_id = %s
+    """, (telegram_id,))
+
+async def notify_applicant_deleted(cur, telegram_id):
+    await cur.execute(
+        "SELECT pg_notify('applicant_changes', json_build_object('op', 'delete', 'telegram_id', %s::bigint)::text)",
+        (telegram_id,)
+    )
 
-def ensure_table():
+def create_admin_token(telegram_id):
+    # <telegram_id>.<expires_at>.<nonce>.<signature>; the panel swaps it for a session cookie
+    expires_at = int(time.time()) + ADMIN_TOKEN_TTL_MINUTES * 60
+    payload = f"{telegram_id}.{expires_at}.{uuid.uuid4().hex[:12]}"
+    digest = hmac.new(ADMIN_TOKEN_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return f"{payload}.{base64.urlsafe_b64encode(digest).rstrip(b'=').decode()}"
+
+def remember_message_pair(admin_message_id, user_message_id, telegram_id, thread_id):
+    pair = (admin_message_id, user_message_id, telegram_id, thread_id)
+    message_pair_cache.put((GROUP_ID, admin_message_id), pair)
+    message_pair_cache.put((telegram_id, user_message_id), pair)
+
+async def lookup_message_pair(chat_id, message_id):
+    # Message ids are only unique per chat, so the chat decides which column to search
+    pair = message_pair_cache.get((chat_id, message_id))
+    if pair is None:
+        # Relayed messages may still be waiting in the write-behind buffer
+        if chat_id == GROUP_ID:
+            pair = write_buffer.find_message_pair(admin_message_id=message_id)
+        else:
+            pair = write_buffer.find_message_pair(user_message_id=message_id, telegram_id=chat_id)
+    if pair is not None:
+        return pair
+
+    async with db_pool.connection() as conn:
+        async with conn.cursor() as cur:
+            if chat_id == GROUP_ID:
+                await cur.execute("""
+                    SELECT admin_message_id, user_message_id, telegram_id, thread_id
+                    FROM message_log
+                    WHERE admin_message_id = %s
+                    ORDER BY id DESC LIMIT 1
+                """, (message_id,))
+            else:
+                await cur.execute("""
+                    SELECT admin_message_id, user_message_id, telegram_id, thread_id
+                    FROM message_log
+                    WHERE user_message_id = %s AND telegram_id = %s AND admin_message_id IS NOT NULL
+                    ORDER BY id DESC LIMIT 1
+                """, (message_id, chat_id))
+            result = await cur.fetchone()
+
+    if result:
+        remember_message_pair(*result)
+    return result
+
+async def get_admin_group_status(bot, user_id):
+    status = membership_cache.get(user_id)
+    if status is None:
+        chat_member = await bot.get_chat_member(chat_id=GROUP_ID, user_id=user_id)
+        status = chat_member.status
+        membership_cache.put(user_id, status)
+    return status
+
+def update_order_key(update):
+    # Admin actions on an applicant are ordered with that applicant's own messages
+    query = update.callback_query if isinstance(update, Update) else None
+    if query is not None and query.data:
+        action, _, rest = query.data.partition(":")
+        applicant_id = rest.split(":")[0]
+        if action in APPLICANT_CALLBACKS and applicant_id.isdigit():
+            return (int(applicant_id), None)
+    return chat_order_key(update)
+
+async def on_topic_mapping_deleted(payload):
+    # The admin panel sends the applicant's telegram_id after removing its mapping
+    topic_cache.invalidate(int(payload))
+    logger.info(f"🔄 Topic mapping invalidated for user {payload}")
+
+async def on_outbox_notification(payload):
+    if outbox_consumer is not None:
+        outbox_consumer.wake()
+
+async def on_broadcast_notification(payload):
+    if broadcast_worker is not None:
+        broadcast_worker.wake()
+
+NOTIFY_HANDLERS = {
+    "topic_mappings": on_topic_mapping_deleted,
+    "bot_outbox": on_outbox_notification,
+    "broadcasts": on_broadcast_notification,
+}
+
+async def outbox_delete_forum_topic(bot, payload):
     try:
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        logger.info("Creating/verifying database tables...")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS applicants (
-                id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                age INTEGER NOT NULL,
-                city TEXT NOT NULL,
-                telegram_id BIGINT NOT NULL UNIQUE,
-                username TEXT,
-                phone TEXT,
-                status TEXT DEFAULT 'New',
-                accepted_city TEXT,
-                accepted_date DATE
-            )
-        """)
-        logger.info("✅ Applicants table verified")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS topic_mappings (
-                id SERIAL PRIMARY KEY,
-                telegram_id BIGINT NOT NULL,
-                thread_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT now()
-            )
-        """)
-        logger.info("✅ Topic mappings table verified")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS admin_tokens (
-                id SERIAL PRIMARY KEY,
-                token VARCHAR(255) NOT NULL,
-                telegram_id BIGINT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        logger.info("✅ Admin tokens table verified")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS message_log (
-                id SERIAL PRIMARY KEY,
-                admin_message_id BIGINT,
-                user_message_id BIGINT,
-                telegram_id BIGINT,
-                thread_id INTEGER,
-                message_type TEXT,
-                created_at TIMESTAMP DEFAULT now()
-            )
-        """)
-        logger.info("✅ Message log table verified")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS message_reactions (
-                id SERIAL PRIMARY KEY,
-                message_id BIGINT NOT NULL,
-                user_id BIGINT NOT NULL,
-                reaction TEXT NOT NULL,
-                is_admin BOOLEAN NOT NULL,
-                created_at TIMESTAMP DEFAULT now()
-            )
-        """)
-        logger.info("✅ Message reactions table verified")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS bot_settings (
-                id SERIAL PRIMARY KEY,
-                key TEXT NOT NULL UNIQUE,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT now()
-            )
-        """)
-        logger.info("✅ Bot settings table verified")
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        logger.info("✅ All tables verified successfully")
+        await bot.delete_forum_topic(chat_id=GROUP_ID, message_thread_id=payload["thread_id"])
+        logger.info(f"🗑️ Deleted forum topic {payload['thread_id']}")
+    except BadRequest as e:
+        # Already deleted by hand counts as done
+        if "not found" not in str(e).lower() and "topic_id_invalid" not in str(e).lower():
+            raise
+        logger.info(f"⚠️ Forum topic {payload['thread_id']} was already gone")
+
+async def outbox_close_forum_topic(bot, payload):
+    try:
+        await bot.close_forum_topic(chat_id=GROUP_ID, message_thread_id=payload["thread_id"])
+        logger.info(f"🔒 Closed forum topic {payload['thread_id']}")
+    except BadRequest as e:
+        if "not found" not in str(e).lower() and "topic_id_invalid" not in str(e).lower() and "not_modified" not in str(e).lower():
+            raise
+        logger.info(f"⚠️ Forum topic {payload['thread_id']} was already gone or closed")
+
+async def send_broadcast_message(bot, recipient, text):
+    # {name}, {city}, {accepted_city} and {accepted_date} are filled in per applicant
+    for field in ("name", "city", "accepted_city", "accepted_date"):
+        text = text.replace("{" + field + "}", str(recipient[field] or "—"))
+    sent_message = await bot.send_message(
+        chat_id=recipient["telegram_id"], text=text, rate_limit_args={"priority": PRIORITY_BULK}
+    )
+    thread_id = await lookup_thread_id(recipient["telegram_id"])
+    write_buffer.add_message(None, sent_message.message_id, recipient["telegram_id"], thread_id, 'broadcast')
+
+async def relay_album(bot, messages, chat_id, telegram_id, thread_id, to_admin):
+    source = messages[0].chat_id
+    copied = await bot.copy_messages(
+        chat_id=chat_id,
+        from_chat_id=source,
+        message_ids=[m.message_id for m in messages],
+        message_thread_id=thread_id if to_admin else None
+    )
+    if len(copied) != len(messages):
+        # Telegram skips items it cannot copy, so the pairs can no longer be matched up
+        logger.warning(f"⚠️ Album from {source}: {len(copied)} of {len(messages)} items copied, edits and reactions will not sync")
+        return
+    for original, copy in zip(messages, copied):
+        admin_message_id, user_message_id = (copy.message_id, original.message_id) if to_admin else (original.message_id, copy.message_id)
+        write_buffer.add_message(admin_message_id, user_message_id, telegram_id, thread_id, 'album')
+        remember_message_pair(admin_message_id, user_message_id, telegram_id, thread_id)
+    target = "to admin group" if to_admin else f"to user {telegram_id}"
+    logger.info(f"✅ Album of {len(messages)} items forwarded {target}")
+
+async def report_broadcast_finished(bot, broadcast_id, total, sent, failed):
+    await bot.send_message(
+        chat_id=GROUP_ID,
+        text=f"📣 Розсилку #{broadcast_id} завершено: надіслано {sent} з {total}, помилок: {failed}",
+        rate_limit_args={"priority": PRIORITY_BULK}
+    )
+
+async def listen_for_notifications():
+    # LISTEN needs its own long-lived connection, outside the pool
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(DB_URL, autocommit=True) as conn:
+                for channel in NOTIFY_HANDLERS:
+                    await conn.execute(f"LISTEN {channel}")
+                logger.info(f"👂 Listening for database notifications: {', '.join(NOTIFY_HANDLERS)}")
+
+                # Re-read the mappings and the outbox so nothing sent while disconnected is missed
+                await warm_topic_cache()
+                await on_outbox_notification(None)
+                await on_broadcast_notification(None)
+
+                async for notify in conn.notifies():
+                    try:
+                        await NOTIFY_HANDLERS[notify.channel](notify.payload)
+                    except Exception as e:
+                        logger.error(f"❌ Failed to handle notification on {notify.channel}: {str(e)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Notification listener failed, reconnecting: {str(e)}")
+            topic_cache.complete = False
+            await asyncio.sleep(5)
+
+def create_db_pool():
+    # One pool shared by all handlers, so DB I/O never blocks the event loop
+    return AsyncConnectionPool(
+        DB_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        kwargs={"cursor_factory": TimedAsyncCursor},
+        open=False
+    )
+
+def register_metric_gauges(update_processor, send_scheduler):
+    for state, stat in (("size", "pool_size"), ("available", "pool_available"), ("waiting", "requests_waiting")):
+        DB_POOL_CONNECTIONS.labels(state).set_function(lambda stat=stat: db_pool.get_stats().get(stat, 0))
+    QUEUE_SIZE.labels("running_updates").set_function(lambda: update_processor.running_updates)
+    QUEUE_SIZE.labels("send").set_function(send_scheduler.queued)
+    QUEUE_SIZE.labels("write_behind").set_function(lambda: len(write_buffer) if write_buffer is not None else 0)
+    QUEUE_SIZE.labels("albums").set_function(lambda: len(album_buffer))
+
+async def on_startup(application):
+    global db_pool, write_buffer, outbox_consumer, broadcast_worker, notification_listener, APPLICANTS_TOPIC_ID
+
+    if db_pool is None:
+        db_pool = create_db_pool()
+    # Already open if the persistence has loaded its data
+    await db_pool.open(wait=True)
+    logger.info(f"✅ Database pool opened (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+
+    write_buffer = WriteBehindBuffer(db_pool, max_rows=WRITE_BEHIND_MAX_ROWS, flush_interval=WRITE_BEHIND_INTERVAL)
+    write_buffer.start()
+
+    outbox_consumer = OutboxConsumer(
+        db_pool,
+        {
+            "delete_forum_topic": partial(outbox_delete_forum_topic, application.bot),
+            "close_forum_topic": partial(outbox_close_forum_topic, application.bot),
+        },
+        batch_size=OUTBOX_BATCH_SIZE,
+        poll_interval=OUTBOX_POLL_INTERVAL,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        permanent_errors=(BadRequest, Forbidden)
+    )
+    outbox_consumer.start()
+
+    broadcast_worker = BroadcastWorker(
+        db_pool,
+        partial(send_broadcast_message, application.bot),
+        on_finished=partial(report_broadcast_finished, application.bot),
+        batch_size=BROADCAST_BATCH_SIZE,
+        poll_interval=BROADCAST_POLL_INTERVAL,
+        permanent_errors=(BadRequest, Forbidden)
+    )
+    broadcast_worker.start()
+
+    # Load applicants topic ID from database
+    try:
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
+                result = await cur.fetchone()
+        if result:
+            APPLICANTS_TOPIC_ID = int(result[0])
+            logger.info(f"✅ Loaded applicants topic ID from database: {APPLICANTS_TOPIC_ID}")
     except Exception as e:
-        logger.error(f"❌ Database initialization failed: {str(e)}")
-        raise
+        logger.error(f"❌ Failed to load applicants topic ID: {str(e)}")
+
+    notification_listener = asyncio.create_task(listen_for_notifications())
+
+async def on_stop(application):
+    # The bot can still send here, so the batches in flight complete
+    await album_buffer.close()
+    if outbox_consumer is not None:
+        await outbox_consumer.close()
+    if broadcast_worker is not None:
+        await broadcast_worker.close()
+
+async def on_shutdown(application):
+    if notification_listener is not None:
+        notification_listener.cancel()
+    if write_buffer is not None:
+        # Store everything still buffered before the pool goes away
+        await write_buffer.close()
+    if db_pool is not None:
+        await db_pool.close()
+        logger.info("✅ Database pool closed")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         telegram_id = update.message.from_user.id
         logger.info(f"🆕 New user started bot: {telegram_id}")
         
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (telegram_id,))
-        exists = cur.fetchone()
-        cur.close()
-        conn.close()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (telegram_id,))
+                exists = await cur.fetchone()
 
         if exists:
             logger.info(f"⚠️ User {telegram_id} already has an application")
@@ -231,23 +539,25 @@ async def get_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         age = user_data['age']
         city = user_data['city']
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (telegram_id,))
-        if cur.fetchone():
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                # The unique telegram_id catches duplicates in the same round trip as the insert
+                await cur.execute(
+                    "INSERT INTO applicants (name, age, city, telegram_id, username, phone) VALUES (%s, %s, %s, %s, %s, %s) "
+                    "ON CONFLICT (telegram_id) DO NOTHING",
+                    (name, age, city, telegram_id, username, phone)
+                )
+                inserted = cur.rowcount > 0
+                if inserted:
+                    await notify_applicant_changed(cur, telegram_id)
+        # The answers live in applicants now, so the persisted form can go
+        clear_form(context)
+
+        if not inserted:
             logger.warning(f"⚠️ Duplicate application attempt from user {telegram_id}")
             await update.message.reply_text("⚠️ Ви вже подали заявку.")
-            cur.close()
-            conn.close()
             return ConversationHandler.END
 
-        cur.execute(
-            "INSERT INTO applicants (name, age, city, telegram_id, username, phone) VALUES (%s, %s, %s, %s, %s, %s)",
-            (name, age, city, telegram_id, username, phone)
-        )
-        conn.commit()
-        cur.close()
-
         link = f"https://t.me/{username}" if username else "❓ Немає username"
         summary = (
             f"✅ Новий користувач:\n"
@@ -302,11 +612,8 @@ async def send_admin_panel_link(update: Update, context: ContextTypes.DEFAULT_TY
 
         # Check if the user is a member of the admin group
         try:
-            chat_member = await context.bot.get_chat_member(
-                chat_id=GROUP_ID,
-                user_id=update.effective_user.id
-            )
-            if chat_member.status not in ['member', 'administrator', 'creator']:
+            member_status = await get_admin_group_status(context.bot, update.effective_user.id)
+            if member_status not in ['member', 'administrator', 'creator']:
                 logger.warning(f"⚠️ Non-member tried to use command: user_id={update.effective_user.id}")
                 return
         except Exception as e:
@@ -336,16 +643,57 @@ async def send_admin_panel_link(update: Update, context: ContextTypes.DEFAULT_TY
         logger.error(f"❌ Error in send_admin_panel_link: {str(e)}")
         await update.message.reply_text("❌ Сталася помилка при створенні панелі адміністратора.")
 
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        if update.effective_chat.id != GROUP_ID:
+            logger.warning(f"⚠️ Command used outside admin group: chat_id={update.effective_chat.id}")
+            return
+
+        try:
+            member_status = await get_admin_group_status(context.bot, update.effective_user.id)
+            if member_status not in ['member', 'administrator', 'creator']:
+                logger.warning(f"⚠️ Non-member tried to use command: user_id={update.effective_user.id}")
+                return
+        except Exception as e:
+            logger.error(f"❌ Error checking group membership: {str(e)}")
+            return
+
+        # First line: /broadcast <status or all> [city]; everything below it is the message
+        first_line, _, text = update.message.text.partition("\n")
+        filters_text = first_line.partition(" ")[2].strip()
+        text = text.strip()
+        status = next((s for s in BROADCAST_STATUSES if filters_text.lower().startswith(s.lower())), None)
+        if status is None and filters_text.lower().startswith("all"):
+            status = "all"
+        if status is None or not text or len(text) > MAX_TEXT_LENGTH:
+            await update.message.reply_text(
+                "❌ Невірний формат команди.\n"
+                "Використання:\n/broadcast <статус|all> [місто]\n<текст повідомлення>\n"
+                "Приклад:\n/broadcast Accepted Київ\nЧекаємо вас {accepted_date} у місті {accepted_city}!\n"
+                f"Доступні статуси: {', '.join(BROADCAST_STATUSES)}. Текст до {MAX_TEXT_LENGTH} символів."
+            )
+            return
+        city = filters_text[len(status):].strip() or None
+
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                broadcast_id, total = await create_broadcast(
+                    cur, text, None if status == "all" else status, city, update.effective_user.id
+                )
+
+        logger.info(f"📣 Broadcast {broadcast_id} to {total} applicants created by {update.effective_user.id}")
+        await update.message.reply_text(f"📣 Розсилку #{broadcast_id} створено: {total} отримувачів.")
+    except Exception as e:
+        logger.error(f"❌ Error in broadcast_command: {str(e)}")
+        await update.message.reply_text("❌ Сталася помилка при створенні розсилки.")
+
 async def admin_panel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     try:
         # Check if the user is a member of the admin group
         try:
-            chat_member = await context.bot.get_chat_member(
-                chat_id=GROUP_ID,
-                user_id=query.from_user.id
-            )
-            if chat_member.status not in ['member', 'administrator', 'creator']:
+            member_status = await get_admin_group_status(context.bot, query.from_user.id)
+            if member_status not in ['member', 'administrator', 'creator']:
                 logger.warning(f"⚠️ Non-member tried to access admin panel: user_id={query.from_user.id}")
                 await query.answer("❌ Ви не є учасником адмін групи", show_alert=True)
                 return
@@ -354,16 +702,9 @@ async def admin_panel_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.answer("❌ Помилка перевірки членства в групі", show_alert=True)
             return
 
-        # Generate token on demand
-        token = uuid.uuid4().hex[:8]
-        logger.info(f"🔑 Generated new admin token on demand: {token}")
-        
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("INSERT INTO admin_tokens(token, telegram_id) VALUES (%s, %s)", (token, query.from_user.id))
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Generate a signed, self-expiring token on demand
+        token = create_admin_token(query.from_user.id)
+        logger.info(f"🔑 Generated new admin token on demand for user {query.from_user.id}")
 
         # Parse the callback data
         _, panel_type = query.data.split(":")
@@ -448,75 +789,73 @@ async def set_status_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         _, tg_id, new_status = query.data.split(":")
         logger.info(f"🔄 Setting status for user {tg_id} to {new_status}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
+        # First, verify the applicant exists (and get user info to preserve it)
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT name, age, city, phone, username, telegram_id, status
+                    FROM applicants WHERE telegram_id = %s
+                """, (tg_id,))
+                user_info = await cur.fetchone()
 
-        # First, verify the applicant exists
-        cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (tg_id,))
-        if not cur.fetchone():
+        if not user_info:
             logger.warning(f"⚠️ Attempted to change status for non-existent applicant {tg_id}")
             await query.answer("❌ Заявку не знайдено.", show_alert=True)
-            cur.close()
-            conn.close()
             return
 
         if new_status == "Accepted":
-            pending_accepts[query.from_user.id] = tg_id
-            # Get user info to preserve it
-            cur.execute("""
-                SELECT name, age, city, phone, username, telegram_id, status
-                FROM applicants WHERE telegram_id = %s
-            """, (tg_id,))
-            user_info = cur.fetchone()
-            
-            if user_info:
-                name, age, city, phone, username, telegram_id, status = user_info
-                username_str = f"@{username}" if username else "—"
-                phone_str = phone if phone else "—"
-                
-                # Escape any potential Markdown characters in user-provided data
-                name_escaped = name.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
-                city_escaped = city.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
-                username_str_escaped = username_str.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
-                phone_str_escaped = phone_str.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
-                
-                user_summary = (
-                    f"👤 Ім'я: {name_escaped}\n"
-                    f"🎂 Вік: {age}\n"
-                    f"🏙️ Місто: {city_escaped}\n"
-                    f"📞 Телефон: {phone_str_escaped}\n"
-                    f"🔗 Username: {username_str_escaped}\n"
-                    f"🆔 Telegram ID: {telegram_id}\n"
-                    f"📊 Статус: {status}\n\n"
-                    f"✅ Прийнято! Введіть команду у форматі:\n"
-                    f"`/accept {tg_id} Київ:2025-07-01`"
-                )
-                try:
-                    await query.edit_message_text(
-                        user_summary,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as md_error:
-                    logger.error(f"❌ Markdown formatting error: {str(md_error)}")
-                    # Fallback to plain text if Markdown fails
-                    await query.edit_message_text(user_summary)
-            else:
+            # Kept in the admin's user_data so it survives restarts
+            context.user_data['pending_accept'] = tg_id
+
+            name, age, city, phone, username, telegram_id, status = user_info
+            username_str = f"@{username}" if username else "—"
+            phone_str = phone if phone else "—"
+
+            # Escape any potential Markdown characters in user-provided data
+            name_escaped = name.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
+            city_escaped = city.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
+            username_str_escaped = username_str.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
+            phone_str_escaped = phone_str.replace("_", "\\_").replace("*", "\\*").replace("`", "\\`").replace("[", "\\[")
+
+            user_summary = (
+                f"👤 Ім'я: {name_escaped}\n"
+                f"🎂 Вік: {age}\n"
+                f"🏙️ Місто: {city_escaped}\n"
+                f"📞 Телефон: {phone_str_escaped}\n"
+                f"🔗 Username: {username_str_escaped}\n"
+                f"🆔 Telegram ID: {telegram_id}\n"
+                f"📊 Статус: {status}\n\n"
+                f"✅ Прийнято! Введіть команду у форматі:\n"
+                f"`/accept {tg_id} Київ:2025-07-01`"
+            )
+            try:
                 await query.edit_message_text(
-                    "✅ Прийнято! Введіть команду у форматі:\n"
-                    f"`/accept {tg_id} Київ:2025-07-01`",
+                    user_summary,
                     parse_mode=ParseMode.MARKDOWN
                 )
+            except Exception as md_error:
+                logger.error(f"❌ Markdown formatting error: {str(md_error)}")
+                # Fallback to plain text if Markdown fails
+                await query.edit_message_text(user_summary)
             # Answer the query with a visible popup
             await query.answer("✅ Статус змінено на 'Прийнято'", show_alert=True)
             logger.info(f"⏳ Waiting for accept command for user {tg_id}")
         else:
             try:
-                cur.execute("UPDATE applicants SET status = %s WHERE telegram_id = %s", (new_status, tg_id))
-                
-                # Get topic info before deletion
-                cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (tg_id,))
-                topic = cur.fetchone()
-                
+                async with db_pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            "UPDATE applicants SET status = %s WHERE telegram_id = %s AND status IS DISTINCT FROM %s",
+                            (new_status, tg_id, new_status)
+                        )
+                        if cur.rowcount:
+                            await notify_applicant_changed(cur, int(tg_id))
+                        # Get topic info while removing the mapping
+                        await cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s RETURNING thread_id", (tg_id,))
+                        topic = await cur.fetchone()
+                topic_cache.invalidate(int(tg_id))
+
+                # The Telegram call runs after the transaction so no pooled connection waits on it
                 if topic:
                     try:
                         await context.bot.delete_forum_topic(chat_id=GROUP_ID, message_thread_id=topic[0])
@@ -524,44 +863,27 @@ async def set_status_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
                     except Exception as e:
                         logger.error(f"❌ Failed to delete forum topic: {str(e)}")
                         # Continue with other operations even if topic deletion fails
-                    cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s", (tg_id,))
-                
-                conn.commit()
-                
-                # Get user info to preserve it
-                cur.execute("""
-                    SELECT name, age, city, phone, username, telegram_id, status
-                    FROM applicants WHERE telegram_id = %s
-                """, (tg_id,))
-                user_info = cur.fetchone()
-                
-                if user_info:
-                    name, age, city, phone, username, telegram_id, status = user_info
-                    username_str = f"@{username}" if username else "—"
-                    phone_str = phone if phone else "—"
-                    user_summary = (
-                        f"👤 Ім'я: {name}\n"
-                        f"🎂 Вік: {age}\n"
-                        f"🏙️ Місто: {city}\n"
-                        f"📞 Телефон: {phone_str}\n"
-                        f"🔗 Username: {username_str}\n"
-                        f"🆔 Telegram ID: {telegram_id}\n"
-                        f"📊 Статус: {new_status}"
-                    )
-                    await query.edit_message_text(user_summary)
-                else:
-                    await query.edit_message_text(f"✅ Статус оновлено: {new_status}")
-                
+
+                name, age, city, phone, username, telegram_id, status = user_info
+                username_str = f"@{username}" if username else "—"
+                phone_str = phone if phone else "—"
+                user_summary = (
+                    f"👤 Ім'я: {name}\n"
+                    f"🎂 Вік: {age}\n"
+                    f"🏙️ Місто: {city}\n"
+                    f"📞 Телефон: {phone_str}\n"
+                    f"🔗 Username: {username_str}\n"
+                    f"🆔 Telegram ID: {telegram_id}\n"
+                    f"📊 Статус: {new_status}"
+                )
+                await query.edit_message_text(user_summary)
+
                 # Answer the query with a visible popup
                 await query.answer(f"✅ Статус змінено на '{new_status}'", show_alert=True)
                 logger.info(f"✅ Status updated for user {tg_id} to {new_status}")
             except Exception as e:
                 logger.error(f"❌ Error updating status: {str(e)}")
-                conn.rollback()
                 await query.answer("❌ Сталася помилка при оновленні статусу.", show_alert=True)
-            finally:
-                cur.close()
-                conn.close()
     except Exception as e:
         logger.error(f"❌ Error in set_status_callback: {str(e)}")
         await query.answer("❌ Сталася помилка при оновленні статусу", show_alert=True)
@@ -595,29 +917,38 @@ async def accept_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-
-        # First, verify the applicant exists
-        cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (telegram_id,))
-        if not cur.fetchone():
-            logger.warning(f"⚠️ Attempted to accept non-existent applicant {telegram_id}")
-            await update.message.reply_text("❌ Заявку не знайдено.")
-            cur.close()
-            conn.close()
-            return
-
         try:
-            cur.execute("""
-                UPDATE applicants
-                SET accepted_city = %s, accepted_date = %s, status = 'Accepted'
-                WHERE telegram_id = %s
-            """, (city.strip(), date.strip(), telegram_id))
-
-            # Get topic info before deletion
-            cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (telegram_id,))
-            topic = cur.fetchone()
-            
+            async with db_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("""
+                        UPDATE applicants
+                        SET accepted_city = %s, accepted_date = %s, status = 'Accepted'
+                        WHERE telegram_id = %s
+                    """, (city.strip(), date.strip(), telegram_id))
+                    found = cur.rowcount > 0
+
+                    topic = None
+                    user_info = None
+                    if found:
+                        await notify_applicant_changed(cur, telegram_id)
+
+                        # Get topic info while removing the mapping
+                        await cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s RETURNING thread_id", (telegram_id,))
+                        topic = await cur.fetchone()
+
+                        # Get user info to show final status
+                        await cur.execute("""
+                            SELECT name, age, city, phone, username, telegram_id, status, accepted_city, accepted_date::text
+                            FROM applicants WHERE telegram_id = %s
+                        """, (telegram_id,))
+                        user_info = await cur.fetchone()
+
+            if not found:
+                logger.warning(f"⚠️ Attempted to accept non-existent applicant {telegram_id}")
+                await update.message.reply_text("❌ Заявку не знайдено.")
+                return
+            topic_cache.invalidate(telegram_id)
+
             if topic:
                 try:
                     await context.bot.delete_forum_topic(chat_id=GROUP_ID, message_thread_id=topic[0])
@@ -625,17 +956,7 @@ async def accept_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except Exception as e:
                     logger.error(f"❌ Failed to delete forum topic: {str(e)}")
                     # Continue with other operations even if topic deletion fails
-                cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s", (telegram_id,))
 
-            conn.commit()
-
-            # Get user info to show final status
-            cur.execute("""
-                SELECT name, age, city, phone, username, telegram_id, status, accepted_city, accepted_date::text
-                FROM applicants WHERE telegram_id = %s
-            """, (telegram_id,))
-            user_info = cur.fetchone()
-            
             if user_info:
                 name, age, city, phone, username, telegram_id, status, accepted_city, accepted_date = user_info
                 username_str = f"@{username}" if username else "—"
@@ -653,14 +974,12 @@ async def accept_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(user_summary)
             else:
                 await update.message.reply_text("✅ Дані збережено та чат закрито.")
+            if context.user_data.get('pending_accept') == str(telegram_id):
+                del context.user_data['pending_accept']
             logger.info(f"✅ Application accepted for user {telegram_id}")
         except Exception as e:
             logger.error(f"❌ Error during acceptance: {str(e)}")
-            conn.rollback()
             await update.message.reply_text("❌ Сталася помилка при збереженні даних.")
-        finally:
-            cur.close()
-            conn.close()
     except Exception as e:
         logger.error(f"❌ Error in accept_command: {str(e)}")
         await update.message.reply_text("❌ Сталася помилка при збереженні даних.")
@@ -674,17 +993,12 @@ async def start_chat_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         applicant_id = int(data.split(":")[1])
         logger.info(f"💬 Starting chat with user {applicant_id}")
-        
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        
+
         # First, check if a chat already exists
-        cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-        existing_topic = cur.fetchone()
-        
-        if existing_topic:
+        thread_id = await lookup_thread_id(applicant_id)
+
+        if thread_id is not None:
             # Chat already exists, update only the button
-            thread_id = existing_topic[0]
             logger.info(f"ℹ️ Chat already exists for user {applicant_id}")
             
             # Create buttons for all users
@@ -703,18 +1017,16 @@ async def start_chat_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
                 reply_markup=keyboard
             )
             await query.answer("ℹ️ Чат вже існує", show_alert=True)
-            cur.close()
-            conn.close()
             return
 
         # If no existing chat, create a new one
-        cur.execute("SELECT name, username, age, city, phone, status FROM applicants WHERE telegram_id = %s", (applicant_id,))
-        result = cur.fetchone()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT name, username, age, city, phone, status FROM applicants WHERE telegram_id = %s", (applicant_id,))
+                result = await cur.fetchone()
         if not result:
             logger.error(f"❌ User {applicant_id} not found in database")
             await query.answer("❌ Користувача не знайдено в базі даних", show_alert=True)
-            cur.close()
-            conn.close()
             return
 
         name, username, age, city, phone, status = result
@@ -728,8 +1040,13 @@ async def start_chat_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.info(f"✅ Created new forum topic for user {applicant_id}")
 
             thread_id = topic.message_thread_id
-            cur.execute("INSERT INTO topic_mappings (telegram_id, thread_id) VALUES (%s, %s)", (applicant_id, thread_id))
-            conn.commit()
+            async with db_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("""
+                        INSERT INTO topic_mappings (telegram_id, thread_id) VALUES (%s, %s)
+                        ON CONFLICT (telegram_id) DO UPDATE SET thread_id = EXCLUDED.thread_id
+                    """, (applicant_id, thread_id))
+            topic_cache.put(applicant_id, thread_id)
 
             link = f"https://t.me/{username}" if username else "❓ Немає username"
             summary = (
@@ -774,11 +1091,7 @@ async def start_chat_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             logger.info(f"✅ Chat started successfully for user {applicant_id}")
         except Exception as e:
             logger.error(f"❌ Error creating forum topic: {str(e)}")
-            conn.rollback()
             await query.answer(f"❌ Помилка при створенні чату: {str(e)[:50]}", show_alert=True)
-        finally:
-            cur.close()
-            conn.close()
     except Exception as e:
         logger.error(f"❌ Error in start_chat_callback: {str(e)}")
         await query.answer("❌ Сталася помилка при створенні чату", show_alert=True)
@@ -805,29 +1118,35 @@ async def delete_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         applicant_id = int(data.split(":")[1])
         logger.info(f"🗑️ Deleting application for user {applicant_id}")
 
-        # First, verify the applicant exists
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        
-        cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (applicant_id,))
-        if not cur.fetchone():
-            logger.warning(f"⚠️ Attempted to delete non-existent applicant {applicant_id}")
-            await query.answer("❌ Заявку не знайдено в базі даних", show_alert=True)
-            # Send a message to notify about the error
-            #await context.bot.send_message(
-            #    chat_id=query.message.chat.id,
-            #    message_thread_id=query.message.message_thread_id if query.message.is_topic_message else None,
-            #    text=f"❌ Заявку не знайдено."
-            #)
-            cur.close()
-            conn.close()
-            return
-
-        # Get topic info before deletion
-        cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
-        topic = cur.fetchone()
-
         try:
+            async with db_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    # First, verify the applicant exists
+                    await cur.execute("SELECT 1 FROM applicants WHERE telegram_id = %s", (applicant_id,))
+                    exists = await cur.fetchone()
+
+                    topic = None
+                    if exists:
+                        # Get topic info while removing the mapping
+                        await cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s RETURNING thread_id", (applicant_id,))
+                        topic = await cur.fetchone()
+
+                        # Delete the applicant data
+                        await cur.execute("DELETE FROM applicants WHERE telegram_id = %s", (applicant_id,))
+                        await notify_applicant_deleted(cur, applicant_id)
+
+            if not exists:
+                logger.warning(f"⚠️ Attempted to delete non-existent applicant {applicant_id}")
+                await query.answer("❌ Заявку не знайдено в базі даних", show_alert=True)
+                # Send a message to notify about the error
+                #await context.bot.send_message(
+                #    chat_id=query.message.chat.id,
+                #    message_thread_id=query.message.message_thread_id if query.message.is_topic_message else None,
+                #    text=f"❌ Заявку не знайдено."
+                #)
+                return
+            topic_cache.invalidate(applicant_id)
+
             # Delete the topic if it exists
             if topic:
                 try:
@@ -835,20 +1154,14 @@ async def delete_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
                     logger.info(f"✅ Deleted forum topic for user {applicant_id}")
                 except Exception as e:
                     logger.error(f"❌ Failed to delete forum topic: {str(e)}")
-                    # Continue with other deletions even if topic deletion fails
-                cur.execute("DELETE FROM topic_mappings WHERE telegram_id = %s", (applicant_id,))
+                    # Continue even if topic deletion fails
 
-            # Delete the applicant data
-            cur.execute("DELETE FROM applicants WHERE telegram_id = %s", (applicant_id,))
-            conn.commit()
-            
             # Only after successful deletion, update the message
             await query.edit_message_text("🗑️ Заявку видалено.")
             await query.answer("✅ Заявку успішно видалено", show_alert=True)
             logger.info(f"✅ Application deleted for user {applicant_id}")
         except Exception as e:
             logger.error(f"❌ Error during deletion: {str(e)}")
-            conn.rollback()  # Rollback any partial changes
             await query.answer(f"❌ Помилка при видаленні заявки: {str(e)[:50]}", show_alert=True)
             # Send a message to notify about the error
             #await context.bot.send_message(
@@ -856,9 +1169,6 @@ async def delete_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             #    message_thread_id=query.message.message_thread_id if query.message.is_topic_message else None,
             #    text=f"❌ Сталася помилка при видаленні заявки."
             #)
-        finally:
-            cur.close()
-            conn.close()
     except Exception as e:
         logger.error(f"❌ Error in delete_user_callback: {str(e)}")
         await query.answer(f"❌ Сталася помилка: {str(e)[:50]}", show_alert=True)
@@ -891,17 +1201,29 @@ async def handle_admin_group_messages(update: Update, context: ContextTypes.DEFA
         thread_id = msg.message_thread_id
         logger.info(f"📨 Processing admin message in thread {thread_id}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT telegram_id FROM topic_mappings WHERE thread_id = %s", (thread_id,))
-        result = cur.fetchone()
-        if not result:
+        applicant_id = await lookup_applicant_id(thread_id)
+        if applicant_id is None:
             logger.warning(f"⚠️ No user mapping found for thread {thread_id}")
             return
 
-        applicant_id = result[0]
-        cur.execute("UPDATE applicants SET status = %s WHERE telegram_id = %s", ("In Progress", applicant_id))
-        conn.commit()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                # Only the first reply changes the status, so later messages write nothing
+                await cur.execute(
+                    "UPDATE applicants SET status = 'In Progress' WHERE telegram_id = %s AND status IS DISTINCT FROM 'In Progress'",
+                    (applicant_id,)
+                )
+                if cur.rowcount:
+                    await notify_applicant_changed(cur, applicant_id)
+
+        chat_key = (GROUP_ID, thread_id)
+        if msg.media_group_id:
+            album_buffer.add(chat_key, msg, partial(
+                relay_album, context.bot, chat_id=applicant_id, telegram_id=applicant_id, thread_id=thread_id, to_admin=False
+            ))
+            return
+        # An album sent just before this message goes first
+        await album_buffer.flush(chat_key)
 
         sent_message = None
         try:
@@ -909,17 +1231,11 @@ async def handle_admin_group_messages(update: Update, context: ContextTypes.DEFA
             sent_message = await msg.copy(chat_id=applicant_id)
             
             if sent_message:
-                cur.execute("""
-                    INSERT INTO message_log (admin_message_id, user_message_id, telegram_id, thread_id, message_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (msg.message_id, sent_message.message_id, applicant_id, thread_id, 'message'))
-                conn.commit()
+                write_buffer.add_message(msg.message_id, sent_message.message_id, applicant_id, thread_id, 'message')
+                remember_message_pair(msg.message_id, sent_message.message_id, applicant_id, thread_id)
                 logger.info(f"✅ Message forwarded to user {applicant_id}")
         except Exception as e:
             logger.error(f"❌ Error forwarding message: {str(e)}")
-
-        cur.close()
-        conn.close()
     except Exception as e:
         logger.error(f"❌ Error in handle_admin_group_messages: {str(e)}")
 
@@ -941,16 +1257,19 @@ async def forward_to_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
         telegram_id = update.message.from_user.id
         logger.info(f"📨 Processing user message from {telegram_id}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT thread_id FROM topic_mappings WHERE telegram_id = %s", (telegram_id,))
-        result = cur.fetchone()
-        if not result:
+        thread_id = await lookup_thread_id(telegram_id)
+        if thread_id is None:
             logger.warning(f"⚠️ No thread mapping found for user {telegram_id}")
             return
 
-        thread_id = result[0]
         msg = update.message
+        chat_key = (telegram_id, None)
+        if msg.media_group_id:
+            album_buffer.add(chat_key, msg, partial(
+                relay_album, context.bot, chat_id=GROUP_ID, telegram_id=telegram_id, thread_id=thread_id, to_admin=True
+            ))
+            return
+        await album_buffer.flush(chat_key)
         sent_message = None
 
         try:
@@ -961,22 +1280,21 @@ async def forward_to_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
             if sent_message:
-                cur.execute("""
-                    INSERT INTO message_log (admin_message_id, user_message_id, telegram_id, thread_id, message_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (sent_message.message_id, msg.message_id, telegram_id, thread_id, 'message'))
-                conn.commit()
+                write_buffer.add_message(sent_message.message_id, msg.message_id, telegram_id, thread_id, 'message')
+                remember_message_pair(sent_message.message_id, msg.message_id, telegram_id, thread_id)
                 logger.info(f"✅ Message forwarded to admin group")
         except Exception as e:
             logger.error(f"❌ Error forwarding message: {str(e)}")
-
-        cur.close()
-        conn.close()
     except Exception as e:
         logger.error(f"❌ Error in forward_to_topic: {str(e)}")
 
+def clear_form(context):
+    for field in ('name', 'age', 'city'):
+        context.user_data.pop(field, None)
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
+        clear_form(context)
         logger.info(f"🚫 Conversation cancelled by user {update.message.from_user.id}")
         await update.message.reply_text("🚫 Розмову скасовано.")
         return ConversationHandler.END
@@ -1000,19 +1318,8 @@ async def handle_message_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
         logger.info(f"📝 Thread ID: {thread_id}")
         logger.info(f"📝 Message type: {'text' if edited.text else 'caption' if edited.caption else 'other'}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-
         # Look up the message mapping
-        cur.execute("""
-            SELECT admin_message_id, user_message_id, telegram_id, thread_id
-            FROM message_log
-            WHERE admin_message_id = %s OR user_message_id = %s
-        """, (message_id, message_id))
-
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
+        result = await lookup_message_pair(edited.chat.id, message_id)
 
         if not result:
             logger.warning("❌ No message mapping found in database")
@@ -1022,7 +1329,7 @@ async def handle_message_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
         logger.info(f"✅ Found message mapping - admin_msg: {admin_msg_id}, user_msg: {user_msg_id}, user_id: {telegram_id}, thread_id: {stored_thread_id}")
 
         try:
-            if message_id == admin_msg_id:
+            if edited.chat.id == GROUP_ID:
                 logger.info("🔄 Processing admin edit -> user")
                 # Admin edited — update user
                 if edited.text:
@@ -1042,7 +1349,7 @@ async def handle_message_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
                     )
                     logger.info("✅ Updated user's message caption")
 
-            elif message_id == user_msg_id:
+            else:
                 logger.info("🔄 Processing user edit -> admin")
                 # User edited — update admin
                 prefix = "👤 "
@@ -1068,6 +1375,19 @@ async def handle_message_edit(update: Update, context: ContextTypes.DEFAULT_TYPE
     except Exception as e:
         logger.error(f"❌ Error in handle_message_edit: {str(e)}")
 
+async def track_admin_group_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        member_update = update.chat_member
+        if not member_update or member_update.chat.id != GROUP_ID:
+            return
+
+        # Joins, promotions and removals replace the cached status straight away
+        new_member = member_update.new_chat_member
+        membership_cache.put(new_member.user.id, new_member.status)
+        logger.info(f"👥 Admin group membership changed: user_id={new_member.user.id}, status={new_member.status}")
+    except Exception as e:
+        logger.error(f"❌ Error in track_admin_group_membership: {str(e)}")
+
 async def handle_message_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if not update.message_reaction:
@@ -1080,28 +1400,18 @@ async def handle_message_reaction(update: Update, context: ContextTypes.DEFAULT_
         
         logger.info(f"😀 Processing reaction change from user {user_id} on message {message_id} in chat {chat_id}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-
         # Look up the message mapping
-        cur.execute("""
-            SELECT admin_message_id, user_message_id, telegram_id, thread_id
-            FROM message_log
-            WHERE admin_message_id = %s OR user_message_id = %s
-        """, (message_id, message_id))
-
-        result = cur.fetchone()
+        result = await lookup_message_pair(chat_id, message_id)
         if not result:
             logger.warning(f"❌ No message mapping found for reaction on message {message_id}")
-            cur.close()
-            conn.close()
             return
 
         admin_msg_id, user_msg_id, telegram_id, thread_id = result
         logger.info(f"✅ Found message mapping - admin_msg: {admin_msg_id}, user_msg: {user_msg_id}, user_id: {telegram_id}, thread_id: {thread_id}")
 
+        is_admin = chat_id == GROUP_ID
         try:
-            if message_id == admin_msg_id:
+            if is_admin:
                 logger.info("🔄 Processing admin reaction -> user")
                 # Admin reacted — update user
                 await context.bot.set_message_reaction(
@@ -1111,7 +1421,7 @@ async def handle_message_reaction(update: Update, context: ContextTypes.DEFAULT_
                 )
                 logger.info("✅ Updated reaction on user's message")
 
-            elif message_id == user_msg_id:
+            else:
                 logger.info("🔄 Processing user reaction -> admin")
                 # User reacted — update admin
                 # For forum topics, we need to use the full chat_id format
@@ -1123,23 +1433,15 @@ async def handle_message_reaction(update: Update, context: ContextTypes.DEFAULT_
                 )
                 logger.info("✅ Updated reaction on admin's message")
 
-            # Update reaction in the database
-            if reaction.old_reaction:
-                # If there was an old reaction, update it
-                cur.execute("""
-                    UPDATE message_reactions 
-                    SET reaction = %s 
-                    WHERE message_id = %s AND user_id = %s
-                """, (str(reaction.new_reaction[0].type) if reaction.new_reaction else '', message_id, user_id))
-            else:
-                # If there was no old reaction, insert new one
-                cur.execute("""
-                    INSERT INTO message_reactions (message_id, user_id, reaction, is_admin)
-                    VALUES (%s, %s, %s, %s)
-                """, (message_id, user_id, str(reaction.new_reaction[0].type) if reaction.new_reaction else '', message_id == admin_msg_id))
-            
-            conn.commit()
-            logger.info("✅ Reaction updated in database")
+            # Queue the reaction for the database: an update if there was an old reaction, an insert otherwise
+            write_buffer.add_reaction(
+                message_id,
+                user_id,
+                str(reaction.new_reaction[0].type) if reaction.new_reaction else '',
+                is_admin,
+                bool(reaction.old_reaction)
+            )
+            logger.info("✅ Reaction queued for the database")
 
         except Exception as e:
             logger.error(f"❌ Reaction sync failed: {str(e)}")
@@ -1147,9 +1449,6 @@ async def handle_message_reaction(update: Update, context: ContextTypes.DEFAULT_
             # Try to log more details about the error
             if hasattr(e, 'response'):
                 logger.error(f"Response: {e.response}")
-
-        cur.close()
-        conn.close()
     except Exception as e:
         logger.error(f"❌ Error in handle_message_reaction: {str(e)}")
         logger.error(f"Error type: {type(e)}")
@@ -1175,11 +1474,8 @@ async def applicants_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
         # Check if the user is a member of the admin group
         user_id = message.from_user.id if message else update.callback_query.from_user.id
         try:
-            chat_member = await context.bot.get_chat_member(
-                chat_id=GROUP_ID,
-                user_id=user_id
-            )
-            if chat_member.status not in ['member', 'administrator', 'creator']:
+            member_status = await get_admin_group_status(context.bot, user_id)
+            if member_status not in ['member', 'administrator', 'creator']:
                 logger.warning(f"⚠️ Non-member tried to use command: user_id={user_id}")
                 if update.callback_query:
                     await update.callback_query.answer("❌ Ви не є учасником адмін групи", show_alert=True)
@@ -1205,6 +1501,9 @@ async def applicants_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
 
         status = args[0]
         page = int(args[1]) if len(args) > 1 else 1
+        # Navigation buttons carry a keyset cursor: "next" lists ids below it, "prev" ids above it
+        direction = args[2] if len(args) > 3 else None
+        cursor_id = int(args[3]) if len(args) > 3 else None
         per_page = 20
 
         if status not in ['New', 'In Progress', 'Accepted', 'Declined']:
@@ -1219,42 +1518,61 @@ async def applicants_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
 
         logger.info(f"📋 Listing applicants with status {status}, page {page}")
 
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-
-        # Get total count
-        cur.execute("SELECT COUNT(*) FROM applicants WHERE status = %s", (status,))
-        total_count = cur.fetchone()[0]
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                # Get total count
+                await cur.execute("SELECT total FROM applicant_status_counts WHERE status = %s", (status,))
+                count_row = await cur.fetchone()
+                total_count = count_row[0] if count_row else 0
+
+                rows = []
+                if total_count > 0:
+                    # Calculate total pages
+                    total_pages = (total_count + per_page - 1) // per_page
+                    if page < 1 or page > total_pages:
+                        page = 1
+                        direction = None
+
+                    # Get applicants for current page
+                    columns = """
+                        SELECT name, age, city, phone, username, telegram_id, status, 
+                               accepted_city, accepted_date::text, id
+                        FROM applicants 
+                    """
+                    if direction == "next":
+                        await cur.execute(columns + """
+                            WHERE status = %s AND id < %s
+                            ORDER BY id DESC
+                            LIMIT %s
+                        """, (status, cursor_id, per_page))
+                        rows = await cur.fetchall()
+                    elif direction == "prev":
+                        await cur.execute(columns + """
+                            WHERE status = %s AND id > %s
+                            ORDER BY id ASC
+                            LIMIT %s
+                        """, (status, cursor_id, per_page))
+                        rows = list(reversed(await cur.fetchall()))
+
+                    if not rows:
+                        # Pages typed into the command (or cursors whose rows are gone) fall back to an offset
+                        if direction is not None:
+                            page = 1
+                        offset = (page - 1) * per_page
+                        await cur.execute(columns + """
+                            WHERE status = %s 
+                            ORDER BY id DESC 
+                            LIMIT %s OFFSET %s
+                        """, (status, per_page, offset))
+                        rows = await cur.fetchall()
 
         if total_count == 0:
             if message:
                 await message.reply_text(f"📭 Немає заявок зі статусом {status}")
             elif update.callback_query:
                 await update.callback_query.answer(f"📭 Немає заявок зі статусом {status}", show_alert=True)
-            cur.close()
-            conn.close()
             return
 
-        # Calculate total pages
-        total_pages = (total_count + per_page - 1) // per_page
-        if page < 1 or page > total_pages:
-            page = 1
-
-        # Get applicants for current page
-        offset = (page - 1) * per_page
-        cur.execute("""
-            SELECT name, age, city, phone, username, telegram_id, status, 
-                   accepted_city, accepted_date::text
-            FROM applicants 
-            WHERE status = %s 
-            ORDER BY id DESC 
-            LIMIT %s OFFSET %s
-        """, (status, per_page, offset))
-
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
         # Create table header
         table = "📋 Заявки зі статусом " + status + f" (сторінка {page}/{total_pages}):\n\n"
         table += "👤 Ім'я | 🎂 Вік | 🏙️ Місто | 📞 Телефон | 🔗 Username | 📊 Статус\n"
@@ -1262,7 +1580,7 @@ async def applicants_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
 
         # Add rows
         for row in rows:
-            name, age, city, phone, username, telegram_id, status, accepted_city, accepted_date = row
+            name, age, city, phone, username, telegram_id, status, accepted_city, accepted_date, _ = row
             username_str = f"@{username}" if username else "—"
             phone_str = phone if phone else "—"
             table += f"{name} | {age} | {city} | {phone_str} | {username_str} | {status}\n"
@@ -1273,11 +1591,11 @@ async def applicants_by_status(update: Update, context: ContextTypes.DEFAULT_TYP
         keyboard = []
         nav_row = []
         
-        if page > 1:
-            nav_row.append(InlineKeyboardButton("◀️", callback_data=f"nav:{status}:{page-1}"))
+        if page > 1 and rows:
+            nav_row.append(InlineKeyboardButton("◀️", callback_data=f"nav:{status}:{page-1}:prev:{rows[0][-1]}"))
         nav_row.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="ignore"))
-        if page < total_pages:
-            nav_row.append(InlineKeyboardButton("▶️", callback_data=f"nav:{status}:{page+1}"))
+        if page < total_pages and rows:
+            nav_row.append(InlineKeyboardButton("▶️", callback_data=f"nav:{status}:{page+1}:next:{rows[-1][-1]}"))
         
         if nav_row:
             keyboard.append(nav_row)
@@ -1341,11 +1659,11 @@ async def handle_navigation_callback(update: Update, context: ContextTypes.DEFAU
             await query.answer("Поточна сторінка", show_alert=True)
             return
 
-        # Parse the navigation data
-        _, status, page = query.data.split(":")
+        # Parse the navigation data: nav:<status>:<page>[:<direction>:<cursor id>]
+        _, status, page, *cursor = query.data.split(":")
         
         # Set the context args for applicants_by_status
-        context.args = [status, page]
+        context.args = [status, page, *cursor]
         
         # Call applicants_by_status with the new parameters
         await applicants_by_status(update, context)
@@ -1365,11 +1683,8 @@ async def create_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
 
         # Check if the user is a member of the admin group
         try:
-            chat_member = await context.bot.get_chat_member(
-                chat_id=GROUP_ID,
-                user_id=update.effective_user.id
-            )
-            if chat_member.status not in ['member', 'administrator', 'creator']:
+            member_status = await get_admin_group_status(context.bot, update.effective_user.id)
+            if member_status not in ['member', 'administrator', 'creator']:
                 logger.warning(f"⚠️ Non-member tried to use command: user_id={update.effective_user.id}")
                 return
         except Exception as e:
@@ -1379,10 +1694,10 @@ async def create_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
         global APPLICANTS_TOPIC_ID
         
         # Check if topic already exists in database
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
-        result = cur.fetchone()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
+                result = await cur.fetchone()
         
         if result:
             APPLICANTS_TOPIC_ID = int(result[0])
@@ -1390,8 +1705,6 @@ async def create_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
                 f"ℹ️ Тема для заявок вже існує (ID: {APPLICANTS_TOPIC_ID}).\n"
                 "Використовуйте /delete_applicants_topic щоб видалити поточну тему."
             )
-            cur.close()
-            conn.close()
             return
 
         # Create the topic
@@ -1402,13 +1715,14 @@ async def create_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
         APPLICANTS_TOPIC_ID = topic.message_thread_id
 
         # Store the topic ID in database
-        cur.execute("""
-            INSERT INTO bot_settings (key, value)
-            VALUES ('applicants_topic_id', %s)
-            ON CONFLICT (key) DO UPDATE
-            SET value = EXCLUDED.value, updated_at = now()
-        """, (str(APPLICANTS_TOPIC_ID),))
-        conn.commit()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO bot_settings (key, value)
+                    VALUES ('applicants_topic_id', %s)
+                    ON CONFLICT (key) DO UPDATE
+                    SET value = EXCLUDED.value, updated_at = now()
+                """, (str(APPLICANTS_TOPIC_ID),))
 
         # Close the topic
         await context.bot.close_forum_topic(
@@ -1424,9 +1738,6 @@ async def create_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
             f"Всі нові заявки будуть надходити сюди.\n"
             f"🔒 Тема закрита - тільки бот може надсилати повідомлення."
         )
-        
-        cur.close()
-        conn.close()
     except Exception as e:
         logger.error(f"❌ Failed to create applicants topic: {str(e)}")
         await update.message.reply_text("❌ Сталася помилка при створенні теми.")
@@ -1447,15 +1758,13 @@ async def delete_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
         global APPLICANTS_TOPIC_ID
         
         # Check if topic exists in database
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
-        result = cur.fetchone()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
+                result = await cur.fetchone()
         
         if not result:
             await update.message.reply_text("ℹ️ Тема для заявок ще не створена.")
-            cur.close()
-            conn.close()
             return
 
         APPLICANTS_TOPIC_ID = int(result[0])
@@ -1467,8 +1776,9 @@ async def delete_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
         )
         
         # Remove from database
-        cur.execute("DELETE FROM bot_settings WHERE key = 'applicants_topic_id'")
-        conn.commit()
+        async with db_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM bot_settings WHERE key = 'applicants_topic_id'")
         
         # Clear the global variable
         APPLICANTS_TOPIC_ID = None
@@ -1479,31 +1789,34 @@ async def delete_applicants_topic(update: Update, context: ContextTypes.DEFAULT_
             "✅ Тема для заявок видалена.\n"
             "Використовуйте /create_applicants_topic щоб створити нову тему."
         )
-        
-        cur.close()
-        conn.close()
     except Exception as e:
         logger.error(f"❌ Failed to delete applicants topic: {str(e)}")
         await update.message.reply_text("❌ Сталася помилка при видаленні теми.")
 
 if __name__ == '__main__':
-    ensure_table()
-    
-    # Load applicants topic ID from database
-    try:
-        conn = psycopg2.connect(DB_URL)
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM bot_settings WHERE key = 'applicants_topic_id'")
-        result = cur.fetchone()
-        if result:
-            APPLICANTS_TOPIC_ID = int(result[0])
-            logger.info(f"✅ Loaded applicants topic ID from database: {APPLICANTS_TOPIC_ID}")
-        cur.close()
-        conn.close()
-    except Exception as e:
-        logger.error(f"❌ Failed to load applicants topic ID: {str(e)}")
-    
-    app = ApplicationBuilder().token(TOKEN).build()
+    migrate(DB_URL)
+    db_pool = create_db_pool()
+
+    update_processor = ChatOrderedUpdateProcessor(CONCURRENT_UPDATES, update_order_key)
+    send_scheduler = SendScheduler(
+        global_rate=SEND_GLOBAL_RATE,
+        private_rate=SEND_PRIVATE_CHAT_RATE,
+        group_rate_per_minute=SEND_GROUP_RATE_PER_MINUTE,
+        max_retries=SEND_MAX_RETRIES
+    )
+
+    builder = ApplicationBuilder().token(TOKEN).persistence(PostgresPersistence(db_pool, PERSISTENCE_INTERVAL))
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    app = (
+        builder
+        .concurrent_updates(update_processor)
+        .rate_limiter(send_scheduler)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
@@ -1514,6 +1827,8 @@ if __name__ == '__main__':
             PHONE: [MessageHandler(filters.ALL & ~filters.COMMAND, get_phone)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="application",
+        persistent=True,
     )
 
     app.add_handler(conv_handler)
@@ -1526,9 +1841,32 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler("create_applicants_topic", create_applicants_topic))
     app.add_handler(CommandHandler("delete_applicants_topic", delete_applicants_topic))
     app.add_handler(CommandHandler("accept", accept_command))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
     app.add_handler(CallbackQueryHandler(set_status_callback, pattern="^set_status:"))
     app.add_handler(MessageHandler(filters.UpdateType.EDITED, handle_message_edit))
     app.add_handler(MessageHandler(filters.Chat(GROUP_ID) & filters.ALL & ~filters.COMMAND, handle_admin_group_messages))
     app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, forward_to_topic))
     app.add_handler(MessageReactionHandler(callback=handle_message_reaction))
-    app.run_polling()
\ No newline at end of file
+    app.add_handler(ChatMemberHandler(track_admin_group_membership, ChatMemberHandler.CHAT_MEMBER))
+
+    instrument_handlers(
+        [handler for group in app.handlers.values() for handler in group],
+        {NAME: "name", AGE: "age", CITY: "city", PHONE: "phone", ConversationHandler.END: "end", None: "unchanged"}
+    )
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT, addr=METRICS_ADDR)
+        register_metric_gauges(update_processor, send_scheduler)
+        logger.info(f"📈 Metrics served on {METRICS_ADDR}:{METRICS_PORT}")
+    # chat_member and message_reaction updates are only delivered when requested explicitly
+    if WEBHOOK_URL:
+        logger.info(f"🌐 Receiving updates via webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
\ No newline at end of file
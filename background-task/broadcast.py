@@ -0,0 +1,194 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_LENGTH = 4096
+
+
+async def create_broadcast(cur, text, status=None, city=None, created_by=None):
+    """Queues text for every applicant matching the filters; returns (id, recipients).
+
+    Recipients are fixed here, so applicants who arrive later do not get it.
+    The city filter matches the applicant's city or accepted city.
+    """
+    await cur.execute("""
+        INSERT INTO broadcasts (text, status_filter, city_filter, created_by)
+        VALUES (%s, %s, %s, %s) RETURNING id
+    """, (text, status, city, created_by))
+    broadcast_id = (await cur.fetchone())[0]
+    await cur.execute("""
+        INSERT INTO broadcast_recipients (broadcast_id, telegram_id)
+        SELECT %s, telegram_id FROM applicants
+        WHERE (%s::text IS NULL OR status = %s)
+          AND (%s::text IS NULL OR lower(city) = lower(%s) OR lower(accepted_city) = lower(%s))
+    """, (broadcast_id, status, status, city, city, city))
+    total = cur.rowcount
+    await cur.execute("UPDATE broadcasts SET total = %s WHERE id = %s", (total, broadcast_id))
+    await cur.execute("NOTIFY broadcasts")
+    return broadcast_id, total
+
+
+class BroadcastWorker:
+    """Sends queued broadcasts to their recipients, batch_size messages at a time.
+
+    send(recipient, text) delivers one message; the rate limiter decides how
+    fast that goes. A batch is claimed by setting claimed_until, so workers
+    in several bot instances never send to the same recipients, and a claim
+    left by a crashed worker runs out after lease_seconds. Results are
+    stored after every batch, so after a crash at most one batch goes out
+    twice. Recipients failing with one of permanent_errors, or max_attempts
+    times, are marked failed.
+    on_finished(broadcast_id, total, sent, failed) is called once per
+    broadcast, by the worker that stored its last result.
+    """
+
+    def __init__(self, pool, send, on_finished=None, batch_size=20, poll_interval=30.0, lease_seconds=300,
+                 max_attempts=3, permanent_errors=()):
+        self.pool = pool
+        self.send = send
+        self.on_finished = on_finished
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.permanent_errors = permanent_errors
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Lets the batch in flight finish, so it is not sent again after the restart
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def process_batch(self):
+        """Sends one batch; returns the number of recipients that are done."""
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    WITH claimed AS (
+                        UPDATE broadcast_recipients
+                        SET claimed_until = NOW() + make_interval(secs => %s)
+                        WHERE (broadcast_id, telegram_id) IN (
+                            SELECT r.broadcast_id, r.telegram_id
+                            FROM broadcast_recipients r
+                            JOIN broadcasts b ON b.id = r.broadcast_id
+                            WHERE r.sent_at IS NULL AND r.error IS NULL AND b.finished_at IS NULL
+                              AND (r.claimed_until IS NULL OR r.claimed_until < NOW())
+                            ORDER BY r.broadcast_id, r.telegram_id
+                            LIMIT %s
+                            FOR UPDATE OF r SKIP LOCKED
+                        )
+                        RETURNING broadcast_id, telegram_id, attempts
+                    )
+                    SELECT c.broadcast_id, c.telegram_id, c.attempts, b.text,
+                           a.name, a.city, a.accepted_city, a.accepted_date::text
+                    FROM claimed c
+                    JOIN broadcasts b ON b.id = c.broadcast_id
+                    LEFT JOIN applicants a ON a.telegram_id = c.telegram_id
+                    ORDER BY c.broadcast_id, c.telegram_id
+                """, (self.lease_seconds, self.batch_size))
+                rows = await cur.fetchall()
+
+        recipients = []
+        for broadcast_id, telegram_id, attempts, text, name, city, accepted_city, accepted_date in rows:
+            recipient = {
+                "broadcast_id": broadcast_id, "telegram_id": telegram_id, "attempts": attempts + 1,
+                "name": name, "city": city, "accepted_city": accepted_city, "accepted_date": accepted_date,
+            }
+            recipients.append((recipient, text))
+
+        results = await asyncio.gather(
+            *(self._send(recipient, text) for recipient, text in recipients), return_exceptions=True
+        )
+
+        sent = []
+        failed = []
+        retries = []
+        for (recipient, _), result in zip(recipients, results):
+            key = (recipient["broadcast_id"], recipient["telegram_id"])
+            if not isinstance(result, Exception):
+                sent.append(key)
+            elif isinstance(result, (LookupError,) + self.permanent_errors) or recipient["attempts"] >= self.max_attempts:
+                logger.warning(f"⚠️ Broadcast {key[0]} to {key[1]} failed: {str(result)}")
+                failed.append((str(result),) + key)
+            else:
+                retries.append((str(result),) + key)
+
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                if sent:
+                    await cur.executemany(
+                        "UPDATE broadcast_recipients SET sent_at = NOW(), attempts = attempts + 1 WHERE broadcast_id = %s AND telegram_id = %s",
+                        sent
+                    )
+                if failed:
+                    await cur.executemany(
+                        "UPDATE broadcast_recipients SET error = %s, attempts = attempts + 1 WHERE broadcast_id = %s AND telegram_id = %s",
+                        failed
+                    )
+                if retries:
+                    await cur.executemany(
+                        "UPDATE broadcast_recipients SET last_error = %s, attempts = attempts + 1, claimed_until = NULL "
+                        "WHERE broadcast_id = %s AND telegram_id = %s",
+                        retries
+                    )
+                counts = {}
+                for key in sent:
+                    counts.setdefault(key[0], [0, 0])[0] += 1
+                for _, broadcast_id, _ in failed:
+                    counts.setdefault(broadcast_id, [0, 0])[1] += 1
+                if counts:
+                    await cur.executemany(
+                        "UPDATE broadcasts SET sent = sent + %s, failed = failed + %s WHERE id = %s",
+                        [(sent_count, failed_count, broadcast_id) for broadcast_id, (sent_count, failed_count) in counts.items()]
+                    )
+                # Also finishes broadcasts that matched nobody
+                await cur.execute("""
+                    UPDATE broadcasts b SET finished_at = NOW()
+                    WHERE finished_at IS NULL AND NOT EXISTS (
+                        SELECT 1 FROM broadcast_recipients r
+                        WHERE r.broadcast_id = b.id AND r.sent_at IS NULL AND r.error IS NULL
+                    )
+                    RETURNING id, total, sent, failed
+                """)
+                finished = await cur.fetchall()
+
+        if recipients:
+            logger.info(f"📣 Broadcast batch: {len(sent)} sent, {len(retries)} to retry, {len(failed)} failed")
+        for broadcast_id, total, sent_count, failed_count in finished:
+            logger.info(f"✅ Broadcast {broadcast_id} finished: {sent_count} of {total} sent, {failed_count} failed")
+            if self.on_finished is not None:
+                try:
+                    await self.on_finished(broadcast_id, total, sent_count, failed_count)
+                except Exception as e:
+                    logger.error(f"❌ Failed to report finished broadcast {broadcast_id}: {str(e)}")
+        return len(sent) + len(failed)
+
+    async def _send(self, recipient, text):
+        if recipient["name"] is None:
+            raise LookupError("applicant was deleted")
+        await self.send(recipient, text)
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                if await self.process_batch() and not self._closing:
+                    continue
+            except Exception as e:
+                logger.error(f"❌ Error processing broadcasts: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict
+
+
+class TopicMappingCache:
+    """Bounded two-way telegram_id <-> thread_id map mirroring topic_mappings.
+
+    Least recently used applicants are evicted once maxsize is reached. While
+    nothing has been evicted since the last warm-up the cache holds every
+    mapping, so a miss means "no topic" and needs no database lookup.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.complete = False
+        self._threads = OrderedDict()  # telegram_id -> thread_id
+        self._applicants = {}  # thread_id -> telegram_id
+        self._touched = None
+
+    def __len__(self):
+        return len(self._threads)
+
+    def get_thread_id(self, telegram_id):
+        thread_id = self._threads.get(telegram_id)
+        if thread_id is not None:
+            self._threads.move_to_end(telegram_id)
+        return thread_id
+
+    def get_applicant_id(self, thread_id):
+        telegram_id = self._applicants.get(thread_id)
+        if telegram_id is not None:
+            self._threads.move_to_end(telegram_id)
+        return telegram_id
+
+    def put(self, telegram_id, thread_id):
+        self._touch(telegram_id)
+        self._drop(telegram_id)
+        previous_owner = self._applicants.get(thread_id)
+        if previous_owner is not None:
+            self._touch(previous_owner)
+            self._drop(previous_owner)
+
+        self._threads[telegram_id] = thread_id
+        self._applicants[thread_id] = telegram_id
+        while len(self._threads) > self.maxsize:
+            _, evicted_thread = self._threads.popitem(last=False)
+            self._applicants.pop(evicted_thread, None)
+            self.complete = False
+
+    def invalidate(self, telegram_id):
+        self._touch(telegram_id)
+        self._drop(telegram_id)
+
+    def begin_load(self):
+        # Changes made while the warm-up query runs win over its snapshot
+        self._touched = set()
+
+    def load(self, rows):
+        # rows are (telegram_id, thread_id) pairs, oldest first
+        touched = self._touched or set()
+        self._touched = None
+        kept = [(t, self._threads[t]) for t in touched if t in self._threads]
+
+        self._threads.clear()
+        self._applicants.clear()
+        self.complete = True
+        for telegram_id, thread_id in rows:
+            if telegram_id not in touched:
+                self.put(telegram_id, thread_id)
+        for telegram_id, thread_id in kept:
+            self.put(telegram_id, thread_id)
+
+    def _touch(self, telegram_id):
+        if self._touched is not None:
+            self._touched.add(telegram_id)
+
+    def _drop(self, telegram_id):
+        thread_id = self._threads.pop(telegram_id, None)
+        if thread_id is not None:
+            self._applicants.pop(thread_id, None)
+
+
+class LRUCache:
+    """Small least-recently-used mapping with a fixed capacity."""
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+    def clear(self):
+        self._items.clear()
+
+
+class TTLCache:
+    """LRU cache whose entries expire ttl seconds after they were stored."""
+
+    def __init__(self, ttl, maxsize=1000):
+        self.ttl = ttl
+        self._items = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        entry = self._items.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._items.pop(key)
+            return default
+        return value
+
+    def put(self, key, value):
+        self._items.put(key, (time.monotonic() + self.ttl, value))
+
+    def pop(self, key, default=None):
+        entry = self._items.pop(key)
+        return default if entry is None else entry[1]
@@ -0,0 +1,126 @@
+"""In-process stand-in for the Telegram Bot API, for probes and benchmarks.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>/bot. It
+answers the methods the bot uses with plausible objects after an optional
+delay, serves pushed updates through getUpdates, and reports every call to
+its listeners.
+"""
+import json
+import time
+import asyncio
+from collections import Counter
+from tornado.web import Application, RequestHandler
+
+
+def decode_value(value):
+    # Non-string parameters arrive JSON encoded
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class FakeBotApiHandler(RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, method):
+        params = {k: decode_value(self.get_body_argument(k)) for k in self.request.body_arguments}
+        if not params and self.request.body:
+            try:
+                params = json.loads(self.request.body)
+            except ValueError:
+                params = {}
+        result = await self.api.handle(method, params)
+        self.write({"ok": True, "result": result})
+
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, bot_id=1):
+        self.latency = latency
+        self.bot_id = bot_id
+        self.calls = Counter()
+        self.listeners = []  # callables(method, params), run for every call
+        self.topics = {}  # forum topic name -> message_thread_id
+        self.polling = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._next_thread_id = 1000
+
+    def application(self):
+        return Application([(r"/bot[^/]+/(\w+)", FakeBotApiHandler, {"api": self})])
+
+    def push_update(self, update):
+        """Queues update for getUpdates, numbering it; returns the update_id."""
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    async def close(self):
+        """Answers pending getUpdates calls so their handlers finish."""
+        self._new_updates.set()
+        await asyncio.sleep(0.1)
+
+    def message(self, chat_id, text="", thread_id=None):
+        self._next_message_id += 1
+        message = {
+            "message_id": self._next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "text": text,
+        }
+        if thread_id is not None:
+            message["message_thread_id"] = thread_id
+            message["is_topic_message"] = True
+        return message
+
+    async def handle(self, method, params):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for listener in self.listeners:
+            listener(method, params)
+
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if isinstance(chat_id, (int, str)) and str(chat_id).lstrip("-").isdigit() else 0
+        if method == "getMe":
+            return {"id": self.bot_id, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method == "setWebhook":
+            self.webhook_set.set()
+        if method == "createForumTopic":
+            self._next_thread_id += 1
+            self.topics[params.get("name", "")] = self._next_thread_id
+            return {"message_thread_id": self._next_thread_id, "name": params.get("name", ""), "icon_color": 7322096}
+        if method == "copyMessage":
+            self._next_message_id += 1
+            return {"message_id": self._next_message_id}
+        if method == "copyMessages":
+            ids = []
+            for _ in params.get("message_ids", []):
+                self._next_message_id += 1
+                ids.append({"message_id": self._next_message_id})
+            return ids
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": params.get("user_id", 0), "is_bot": False, "first_name": "Member"}}
+        if (method.startswith("send") and method != "sendChatAction") or method.startswith("edit"):
+            return self.message(chat_id, str(params.get("text", "")), params.get("message_thread_id"))
+        return True
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        self.polling.set()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or 100)]
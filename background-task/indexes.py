@@ -0,0 +1,85 @@
+import logging
+from psycopg.rows import dict_row
+
+logger = logging.getLogger(__name__)
+
+# (name, table, columns, unique). Unique ones are also attached as constraints of the same name.
+PRODUCTION_INDEXES = [
+    ("applicants_status_id_idx", "applicants", "status, id", False),
+    ("topic_mappings_telegram_id_key", "topic_mappings", "telegram_id", True),
+    ("topic_mappings_thread_id_idx", "topic_mappings", "thread_id", False),
+    ("admin_tokens_token_key", "admin_tokens", "token", True),
+    ("message_log_admin_message_id_idx", "message_log", "admin_message_id", False),
+    ("message_log_user_message_id_idx", "message_log", "user_message_id", False),
+    ("message_reactions_message_id_user_id_key", "message_reactions", "message_id, user_id", True),
+]
+
+
+def ensure_indexes(conn):
+    """Builds missing PRODUCTION_INDEXES without blocking writes to their tables.
+
+    Each index is built with CREATE INDEX CONCURRENTLY, so conn has to be in
+    autocommit mode. A build that failed earlier leaves an invalid index
+    behind, which is dropped and built again. Before a unique index is
+    built, duplicate rows are removed and the newest row of each is kept;
+    every removed row is logged, and the forum topics of removed
+    topic_mappings are queued for the bot to close.
+    """
+    for name, table, columns, unique in PRODUCTION_INDEXES:
+        row = conn.execute("""
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace
+        """, (name,)).fetchone()
+        if row is not None and row[0]:
+            if unique:
+                attach_constraint(conn, name, table)
+            continue
+        if row is not None:
+            logger.warning(f"⚠️ Index {name} was left invalid by an interrupted build, rebuilding")
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+        if unique:
+            remove_duplicates(conn, table, columns)
+
+        logger.info(f"🔨 Building index {name} on {table} ({columns})")
+        try:
+            conn.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+        except Exception:
+            # A failed concurrent build leaves an invalid index that would still slow down writes
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            raise
+        if unique:
+            attach_constraint(conn, name, table)
+    logger.info("✅ Indexes verified")
+
+
+def remove_duplicates(conn, table, columns):
+    key = [column.strip() for column in columns.split(",")]
+    match = " AND ".join(f"newer.{column} = t.{column}" for column in key)
+    with conn.transaction(), conn.cursor(row_factory=dict_row) as cur:
+        removed = cur.execute(
+            f"DELETE FROM {table} t USING {table} newer WHERE {match} AND newer.id > t.id RETURNING t.*"
+        ).fetchall()
+        if not removed:
+            return
+        logger.warning(f"⚠️ Removing {len(removed)} duplicate rows from {table} before indexing ({columns})")
+        for row in removed:
+            logger.warning(f"⚠️ Removed from {table}: {row}")
+        if table == "topic_mappings":
+            # Their topics would otherwise stay open with nothing relaying them
+            cur.execute("""
+                INSERT INTO bot_outbox (action, payload)
+                SELECT 'close_forum_topic', jsonb_build_object('thread_id', thread_id)
+                FROM unnest(%s::int[]) AS thread_id
+            """, ([row["thread_id"] for row in removed],))
+            cur.execute("NOTIFY bot_outbox")
+
+
+def attach_constraint(conn, name, table):
+    # Only takes a short lock, the index already exists
+    exists = conn.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (name,)).fetchone()
+    if not exists:
+        conn.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
@@ -0,0 +1,101 @@
+import re
+import time
+import functools
+from contextlib import contextmanager
+import psycopg
+from prometheus_client import Counter, Gauge, Histogram
+from telegram.ext import ConversationHandler
+
+HANDLER_DURATION = Histogram("bot_handler_duration_seconds", "Time spent in update handlers", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Exceptions raised by update handlers", ["handler"])
+CONVERSATION_TRANSITIONS = Counter(
+    "bot_conversation_transitions_total", "Conversation steps, by the state they lead to", ["state"]
+)
+DB_QUERY_DURATION = Histogram(
+    "bot_db_query_duration_seconds", "Database statement latency", ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+DB_QUERY_ERRORS = Counter("bot_db_query_errors_total", "Failed database statements", ["statement"])
+TELEGRAM_REQUEST_DURATION = Histogram(
+    "bot_telegram_request_duration_seconds", "Bot API call latency, without rate limiter waits", ["method"]
+)
+TELEGRAM_ERRORS = Counter("bot_telegram_errors_total", "Failed Bot API calls", ["method", "error"])
+DB_POOL_CONNECTIONS = Gauge("bot_db_pool_connections", "Database pool connections", ["state"])
+QUEUE_SIZE = Gauge("bot_queue_size", "Work waiting inside the bot", ["queue"])
+
+# Labels statements by verb and first table, e.g. "SELECT topic_mappings", to keep the series count bounded
+STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+def statement_label(query):
+    if not isinstance(query, str):
+        query = str(query)
+    words = query.split(None, 1)
+    if not words:
+        return "EMPTY"
+    match = STATEMENT_TABLE.search(query)
+    return f"{words[0].upper()} {match.group(1).lower()}" if match else words[0].upper()
+
+
+@contextmanager
+def observe_query(query):
+    label = statement_label(query)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(label).inc()
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(label).observe(time.perf_counter() - started)
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """Cursor that records every statement in DB_QUERY_DURATION."""
+
+    async def execute(self, query, params=None, **kwargs):
+        with observe_query(query):
+            return await super().execute(query, params, **kwargs)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        with observe_query(query):
+            return await super().executemany(query, params_seq, **kwargs)
+
+
+def timed_callback(name, callback, state_names=None):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            result = await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(name).observe(time.perf_counter() - started)
+        if state_names is not None:
+            CONVERSATION_TRANSITIONS.labels(state_names.get(result, str(result))).inc()
+        return result
+    return wrapper
+
+
+def instrument_handlers(handlers, state_names):
+    """Times the callbacks of handlers, including those inside conversation handlers.
+
+    Conversation steps are also counted by the state they return, named
+    through state_names.
+    """
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            for conversation_handler in nested:
+                _instrument(conversation_handler, state_names)
+        else:
+            _instrument(handler, None)
+
+
+def _instrument(handler, state_names):
+    name = getattr(handler.callback, "__name__", type(handler).__name__)
+    handler.callback = timed_callback(name, handler.callback, state_names)
@@ -0,0 +1,399 @@
+import time
+import logging
+import psycopg
+from indexes import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+# Session-level advisory lock held while migrating; any constant works as long as every process uses it
+MIGRATION_LOCK_ID = 726173
+LOCK_POLL_INTERVAL = 0.5
+
+
+def initial_schema(cur):
+    # IF NOT EXISTS throughout, so databases set up before schema_version existed are adopted as they are
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS applicants (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            age INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            telegram_id BIGINT NOT NULL UNIQUE,
+            username TEXT,
+            phone TEXT,
+            status TEXT DEFAULT 'New',
+            accepted_city TEXT,
+            accepted_date DATE
+        )
+    """)
+    logger.info("✅ Applicants table verified")
+
+    # Per-status totals kept current by triggers, so paging never runs COUNT(*)
+    cur.execute("SELECT to_regclass('applicant_status_counts') IS NULL")
+    backfill_counts = cur.fetchone()[0]
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS applicant_status_counts (
+            status TEXT PRIMARY KEY,
+            total BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION track_applicant_status_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IS NOT NULL THEN
+                UPDATE applicant_status_counts SET total = total - 1 WHERE status = OLD.status;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IS NOT NULL THEN
+                INSERT INTO applicant_status_counts (status, total) VALUES (NEW.status, 1)
+                ON CONFLICT (status) DO UPDATE SET total = applicant_status_counts.total + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS applicants_status_counts_insert_delete ON applicants")
+    cur.execute("""
+        CREATE TRIGGER applicants_status_counts_insert_delete
+        AFTER INSERT OR DELETE ON applicants
+        FOR EACH ROW EXECUTE FUNCTION track_applicant_status_counts()
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS applicants_status_counts_update ON applicants")
+    cur.execute("""
+        CREATE TRIGGER applicants_status_counts_update
+        AFTER UPDATE OF status ON applicants
+        FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION track_applicant_status_counts()
+    """)
+    if backfill_counts:
+        # Writers wait for the one-off count so no change slips between it and the triggers
+        cur.execute("LOCK TABLE applicants IN SHARE ROW EXCLUSIVE MODE")
+        cur.execute("""
+            INSERT INTO applicant_status_counts (status, total)
+            SELECT status, COUNT(*) FROM applicants WHERE status IS NOT NULL GROUP BY status
+        """)
+    logger.info("✅ Applicant status counts verified")
+
+    # Bumped on every change to applicants; the admin panel builds its ETags from it
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS applicants_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT INTO applicants_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION bump_applicants_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE applicants_version SET version = version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Per row, so statements that match nothing do not invalidate anything
+    cur.execute("DROP TRIGGER IF EXISTS applicants_version_bump ON applicants")
+    cur.execute("""
+        CREATE TRIGGER applicants_version_bump
+        AFTER INSERT OR UPDATE OR DELETE ON applicants
+        FOR EACH ROW EXECUTE FUNCTION bump_applicants_version()
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS applicants_version_truncate ON applicants")
+    cur.execute("""
+        CREATE TRIGGER applicants_version_truncate
+        AFTER TRUNCATE ON applicants
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_applicants_version()
+    """)
+    logger.info("✅ Applicants version counter verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS topic_mappings (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            thread_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    logger.info("✅ Topic mappings table verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin_tokens (
+            id SERIAL PRIMARY KEY,
+            token VARCHAR(255) NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    logger.info("✅ Admin tokens table verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS revoked_admin_sessions (
+            sid TEXT PRIMARY KEY,
+            expires_at TIMESTAMPTZ NOT NULL,
+            created_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    logger.info("✅ Revoked admin sessions table verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS message_log (
+            id SERIAL PRIMARY KEY,
+            admin_message_id BIGINT,
+            user_message_id BIGINT,
+            telegram_id BIGINT,
+            thread_id INTEGER,
+            message_type TEXT,
+            created_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    logger.info("✅ Message log table verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS message_reactions (
+            id SERIAL PRIMARY KEY,
+            message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            reaction TEXT NOT NULL,
+            is_admin BOOLEAN NOT NULL,
+            created_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    logger.info("✅ Message reactions table verified")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            id SERIAL PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+    """)
+    logger.info("✅ Bot settings table verified")
+
+    # Conversation states and context.user_data, see persistence.py
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_user_data (
+            user_id BIGINT PRIMARY KEY,
+            data JSONB NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS persisted_conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state JSONB NOT NULL,
+            updated_at TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (name, key)
+        )
+    """)
+    logger.info("✅ Persistence tables verified")
+
+    # Broadcasts and their recipients, see broadcast.py
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id SERIAL PRIMARY KEY,
+            text TEXT NOT NULL,
+            status_filter TEXT,
+            city_filter TEXT,
+            created_by BIGINT,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts (id) ON DELETE CASCADE,
+            telegram_id BIGINT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            sent_at TIMESTAMPTZ,
+            error TEXT,
+            last_error TEXT,
+            PRIMARY KEY (broadcast_id, telegram_id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS broadcast_recipients_pending_idx
+        ON broadcast_recipients (broadcast_id, telegram_id) WHERE sent_at IS NULL AND error IS NULL
+    """)
+    logger.info("✅ Broadcast tables verified")
+
+    # Work the admin panel hands to the bot, written in the same transaction as its change
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS bot_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            action TEXT NOT NULL,
+            payload JSONB NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_error TEXT,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS bot_outbox_available_at_idx ON bot_outbox (available_at, id)")
+    logger.info("✅ Outbox table verified")
+
+
+def statement_level_status_counts(cur):
+    # One upsert per statement instead of two per row, locking the counter rows in status order,
+    # so concurrent transactions moving applicants in opposite directions cannot deadlock
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION track_applicant_status_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO applicant_status_counts (status, total)
+                SELECT status, COUNT(*) FROM new_rows
+                WHERE status IS NOT NULL GROUP BY status ORDER BY status
+                ON CONFLICT (status) DO UPDATE SET total = applicant_status_counts.total + EXCLUDED.total;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO applicant_status_counts (status, total)
+                SELECT status, -COUNT(*) FROM old_rows
+                WHERE status IS NOT NULL GROUP BY status ORDER BY status
+                ON CONFLICT (status) DO UPDATE SET total = applicant_status_counts.total + EXCLUDED.total;
+            ELSE
+                INSERT INTO applicant_status_counts (status, total)
+                SELECT status, SUM(delta) FROM (
+                    SELECT status, 1 AS delta FROM new_rows
+                    UNION ALL
+                    SELECT status, -1 FROM old_rows
+                ) AS change
+                WHERE status IS NOT NULL GROUP BY status HAVING SUM(delta) <> 0 ORDER BY status
+                ON CONFLICT (status) DO UPDATE SET total = applicant_status_counts.total + EXCLUDED.total;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS applicants_status_counts_insert_delete ON applicants")
+    cur.execute("DROP TRIGGER IF EXISTS applicants_status_counts_update ON applicants")
+    # Triggers with transition tables take a single event each
+    cur.execute("""
+        CREATE TRIGGER applicants_status_counts_insert
+        AFTER INSERT ON applicants REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION track_applicant_status_counts()
+    """)
+    cur.execute("""
+        CREATE TRIGGER applicants_status_counts_delete
+        AFTER DELETE ON applicants REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION track_applicant_status_counts()
+    """)
+    cur.execute("""
+        CREATE TRIGGER applicants_status_counts_update
+        AFTER UPDATE ON applicants REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION track_applicant_status_counts()
+    """)
+
+
+def statement_level_applicants_version(cur):
+    # Bumped once per statement that changed rows, instead of once per row on a single hot tuple
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION bump_applicants_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'TRUNCATE' THEN
+                IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            UPDATE applicants_version SET version = version + 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS applicants_version_bump ON applicants")
+    for event, transition in (("INSERT", "NEW"), ("UPDATE", "OLD"), ("DELETE", "OLD")):
+        cur.execute(f"""
+            CREATE TRIGGER applicants_version_{event.lower()}
+            AFTER {event} ON applicants REFERENCING {transition} TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_applicants_version()
+        """)
+
+
+def broadcast_recipient_leases(cur):
+    # Lets every bot instance run a broadcast worker without sending the same message twice
+    cur.execute("ALTER TABLE broadcast_recipients ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ")
+
+
+# (version, description, apply, transactional). Append new migrations, never change applied ones,
+# and set SCHEMA_VERSION in admin-panel/app.py to the new LATEST_VERSION.
+# Transactional migrations get a cursor inside the transaction that records them. The others get
+# an autocommit connection and have to be safe to run again after an interruption.
+MIGRATIONS = [
+    (1, "initial schema", initial_schema, True),
+    (2, "production indexes", ensure_indexes, False),
+    (3, "statement-level applicant status counts", statement_level_status_counts, True),
+    (4, "statement-level applicants version", statement_level_applicants_version, True),
+    (5, "broadcast recipient leases", broadcast_recipient_leases, True),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    try:
+        return conn.execute("SELECT max(version) FROM schema_version").fetchone()[0] or 0
+    except psycopg.errors.UndefinedTable:
+        return 0
+
+
+def migrate(db_url):
+    """Brings the database schema up to LATEST_VERSION.
+
+    When the schema is current this costs one query. Otherwise the pending
+    migrations run under an advisory lock: of several processes starting at
+    once, one migrates while the others wait and then find nothing to do.
+    """
+    try:
+        with psycopg.connect(db_url, autocommit=True) as conn:
+            version = current_version(conn)
+            if version >= LATEST_VERSION:
+                logger.info(f"✅ Database schema is current (version {version})")
+                return
+
+            # Polled instead of blocking in pg_advisory_lock: a waiting statement holds a snapshot,
+            # and CREATE INDEX CONCURRENTLY in the migrating session would wait for it in turn
+            waiting = False
+            while not conn.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_ID,)).fetchone()[0]:
+                if not waiting:
+                    logger.info("⏳ Another process is migrating the database, waiting")
+                    waiting = True
+                time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ DEFAULT NOW()
+                    )
+                """)
+                version = current_version(conn)
+                applied = 0
+                for number, description, apply, transactional in MIGRATIONS:
+                    if number <= version:
+                        continue
+                    logger.info(f"🔄 Applying migration {number}: {description}")
+                    started = time.perf_counter()
+                    if transactional:
+                        with conn.transaction():
+                            with conn.cursor() as cur:
+                                apply(cur)
+                                cur.execute(
+                                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                                    (number, description)
+                                )
+                    else:
+                        apply(conn)
+                        conn.execute(
+                            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                            (number, description)
+                        )
+                    logger.info(f"✅ Migration {number} applied in {time.perf_counter() - started:.1f}s")
+                    applied += 1
+            finally:
+                conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        if applied:
+            logger.info(f"✅ Database schema migrated to version {LATEST_VERSION}")
+        else:
+            logger.info(f"✅ Database schema was migrated by another process (version {LATEST_VERSION})")
+    except Exception as e:
+        logger.error(f"❌ Database migration failed: {str(e)}")
+        raise
@@ -0,0 +1,119 @@
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxConsumer:
+    """Runs the side effects other processes queue in the bot_outbox table.
+
+    Rows are written in the same transaction as the change they belong to and
+    announced with NOTIFY bot_outbox; wake() is called for those
+    notifications, and the table is polled every poll_interval seconds in
+    case one was missed. A batch is claimed by pushing available_at forward,
+    so several workers never run the same row and the claim survives a crash
+    only until the lease runs out. Failed rows are retried with exponential
+    backoff; after max_attempts, or on one of permanent_errors, they are
+    parked with available_at = 'infinity' and their last error.
+    """
+
+    def __init__(self, pool, handlers, batch_size=50, poll_interval=10.0, lease_seconds=60,
+                 max_attempts=8, permanent_errors=()):
+        self.pool = pool
+        self.handlers = handlers  # action -> async callable(payload)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.permanent_errors = permanent_errors
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Lets a running batch finish, so its results are recorded
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def process_batch(self):
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    UPDATE bot_outbox
+                    SET attempts = attempts + 1, available_at = NOW() + make_interval(secs => %s)
+                    WHERE id IN (
+                        SELECT id FROM bot_outbox
+                        WHERE available_at <= NOW()
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, action, payload, attempts
+                """, (self.lease_seconds, self.batch_size))
+                rows = await cur.fetchall()
+        if not rows:
+            return 0
+
+        # The claim is committed, so no transaction stays open during the calls
+        results = await asyncio.gather(*(self._execute(action, payload) for _, action, payload, _ in rows), return_exceptions=True)
+
+        done = []
+        retries = []
+        parked = []
+        for (row_id, action, payload, attempts), result in zip(rows, results):
+            if not isinstance(result, Exception):
+                done.append(row_id)
+            elif isinstance(result, self.permanent_errors) or attempts >= self.max_attempts:
+                logger.error(f"❌ Outbox {action} {json.dumps(payload)} given up after {attempts} attempts: {str(result)}")
+                parked.append((str(result), row_id))
+            else:
+                delay = min(300, 5 * 2 ** (attempts - 1))
+                logger.warning(f"⚠️ Outbox {action} failed, retry {attempts}/{self.max_attempts} in {delay}s: {str(result)}")
+                retries.append((delay, str(result), row_id))
+
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                if done:
+                    await cur.execute("DELETE FROM bot_outbox WHERE id = ANY(%s)", (done,))
+                if retries:
+                    await cur.executemany("""
+                        UPDATE bot_outbox SET available_at = NOW() + make_interval(secs => %s), last_error = %s
+                        WHERE id = %s
+                    """, retries)
+                if parked:
+                    await cur.executemany(
+                        "UPDATE bot_outbox SET available_at = 'infinity', last_error = %s WHERE id = %s",
+                        parked
+                    )
+        logger.info(f"📤 Outbox batch: {len(done)} done, {len(retries)} to retry, {len(parked)} given up")
+        return len(rows)
+
+    async def _execute(self, action, payload):
+        handler = self.handlers.get(action)
+        if handler is None:
+            raise ValueError(f"Unknown outbox action '{action}'")
+        await handler(payload)
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                if await self.process_batch() == self.batch_size and not self._closing:
+                    # Probably more waiting
+                    continue
+            except Exception as e:
+                logger.error(f"❌ Error processing outbox: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
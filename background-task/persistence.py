@@ -0,0 +1,166 @@
+import json
+import asyncio
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+class PostgresPersistence(BasePersistence):
+    """Keeps context.user_data and ConversationHandler states in Postgres.
+
+    The application hands over changed entries every update_interval seconds.
+    Entries whose content really changed are marked dirty and written together
+    in one transaction right after; nothing is written per update. Stored
+    values must be JSON serializable.
+    """
+
+    def __init__(self, pool, update_interval=5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.pool = pool
+        # Serialized values as last stored, to skip writes that change nothing
+        self._stored_users = {}  # user_id -> data
+        self._stored_conversations = {}  # (name, key) -> state
+        # Pending writes; None means delete
+        self._dirty_users = {}
+        self._dirty_conversations = {}
+        self._lock = asyncio.Lock()
+        self._write_task = None
+
+    async def get_user_data(self):
+        # Loaded while the application initializes, before post_init opens the pool
+        await self.pool.open(wait=True)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT user_id, data FROM persisted_user_data")
+                rows = await cur.fetchall()
+        for user_id, data in rows:
+            self._stored_users[user_id] = serialize(data)
+        logger.info(f"✅ Restored user data for {len(rows)} users")
+        return {user_id: data for user_id, data in rows}
+
+    async def get_conversations(self, name):
+        await self.pool.open(wait=True)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT key, state FROM persisted_conversations WHERE name = %s", (name,))
+                rows = await cur.fetchall()
+        for key, state in rows:
+            self._stored_conversations[(name, key)] = serialize(state)
+        logger.info(f"✅ Restored {len(rows)} '{name}' conversations")
+        return {tuple(json.loads(key)): state for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        entry = (name, serialize(list(key)))
+        self._mark(self._dirty_conversations, self._stored_conversations, entry, None if new_state is None else serialize(new_state))
+
+    async def update_user_data(self, user_id, data):
+        # Users that never stored anything do not get a row
+        self._mark(self._dirty_users, self._stored_users, user_id, serialize(data) if data else None)
+
+    async def drop_user_data(self, user_id):
+        self._mark(self._dirty_users, self._stored_users, user_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_dirty()
+
+    def _mark(self, dirty, stored, key, value):
+        if key not in dirty and stored.get(key) == value:
+            return
+        dirty[key] = value
+        if self._write_task is None or self._write_task.done():
+            # Runs once the application has handed over every change of this round
+            self._write_task = asyncio.create_task(self._write_dirty())
+
+    async def _write_dirty(self):
+        async with self._lock:
+            users, self._dirty_users = self._dirty_users, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            if not users and not conversations:
+                return
+
+            try:
+                async with self.pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        upserts = [(user_id, data) for user_id, data in users.items() if data is not None]
+                        deletes = [user_id for user_id, data in users.items() if data is None]
+                        if upserts:
+                            await cur.executemany("""
+                                INSERT INTO persisted_user_data (user_id, data, updated_at)
+                                VALUES (%s, %s::jsonb, NOW())
+                                ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW()
+                            """, upserts)
+                        if deletes:
+                            await cur.execute("DELETE FROM persisted_user_data WHERE user_id = ANY(%s)", (deletes,))
+
+                        upserts = [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+                        deletes = [(name, key) for (name, key), state in conversations.items() if state is None]
+                        if upserts:
+                            await cur.executemany("""
+                                INSERT INTO persisted_conversations (name, key, state, updated_at)
+                                VALUES (%s, %s, %s::jsonb, NOW())
+                                ON CONFLICT (name, key) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+                            """, upserts)
+                        if deletes:
+                            await cur.executemany("DELETE FROM persisted_conversations WHERE name = %s AND key = %s", deletes)
+            except Exception as e:
+                logger.error(f"❌ Failed to persist bot state, keeping the changes for the next write: {str(e)}")
+                # Changes made in the meantime are newer and win
+                for user_id, data in users.items():
+                    self._dirty_users.setdefault(user_id, data)
+                for entry, state in conversations.items():
+                    self._dirty_conversations.setdefault(entry, state)
+                return
+
+            for user_id, data in users.items():
+                if data is None:
+                    self._stored_users.pop(user_id, None)
+                else:
+                    self._stored_users[user_id] = data
+            for entry, state in conversations.items():
+                if state is None:
+                    self._stored_conversations.pop(entry, None)
+                else:
+                    self._stored_conversations[entry] = state
+            logger.info(f"💾 Persisted {len(users)} user data and {len(conversations)} conversation changes")
+
+    # Chat data, bot data and callback data are not stored
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,178 @@
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from datetime import timedelta
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from caches import LRUCache
+from metrics import TELEGRAM_REQUEST_DURATION, TELEGRAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Pass as rate_limit_args={"priority": ...}; lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# These endpoints are answered right away without waiting for a token
+IMMEDIATE_ENDPOINTS = {"answerCallbackQuery"}
+
+
+def creates_message(endpoint):
+    return endpoint.startswith(("send", "copyMessage", "forwardMessage")) or endpoint == "createForumTopic"
+
+
+def is_throttled(endpoint):
+    return creates_message(endpoint) or endpoint.startswith("edit") or endpoint == "setMessageReaction"
+
+
+def is_group_chat(chat_id):
+    return (isinstance(chat_id, int) and chat_id < 0) or (isinstance(chat_id, str) and chat_id.startswith("@"))
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity tokens."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self):
+        # Seconds until a token is available
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        # Tokens may go negative, which reserves a later slot for the caller
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SendScheduler(BaseRateLimiter):
+    """Throttles outgoing Bot API calls to stay within Telegram's limits.
+
+    Every message-creating call waits for a token from its chat's bucket
+    (private and group chats have different limits) and then from a global
+    bucket, which hands out tokens by priority. RetryAfter errors pause the
+    affected chat, or everything for calls without a chat, and the call is
+    repeated up to max_retries times.
+    """
+
+    def __init__(self, global_rate=30, private_rate=1, group_rate_per_minute=20, max_retries=5, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+        self._chat_buckets = LRUCache(max_chats)
+        self._waiting = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+    async def initialize(self):
+        # Both the application and its updater initialize the bot
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        # Let anything still queued go out rather than hang
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+
+    def queued(self):
+        return len(self._waiting)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in IMMEDIATE_ENDPOINTS:
+            priority = PRIORITY_INTERACTIVE
+        else:
+            priority = (rate_limit_args or {}).get("priority", PRIORITY_NORMAL)
+        chat_id = data.get("chat_id")
+
+        retries = 0
+        while True:
+            if endpoint not in IMMEDIATE_ENDPOINTS and is_throttled(endpoint):
+                if chat_id is not None and creates_message(endpoint):
+                    bucket = self._chat_bucket(chat_id)
+                    wait = bucket.delay()
+                    bucket.take()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await self._acquire_global(priority)
+
+            try:
+                return await self._call(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                if retries >= self.max_retries:
+                    logger.error(f"❌ {endpoint} to {chat_id} still rate limited after {retries} retries")
+                    raise
+                retries += 1
+                seconds = e.retry_after
+                if isinstance(seconds, timedelta):
+                    seconds = seconds.total_seconds()
+                logger.warning(f"⏳ {endpoint} to {chat_id} rate limited, retrying in {seconds}s ({retries}/{self.max_retries})")
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(seconds)
+                else:
+                    self.global_bucket.pause(seconds)
+                await asyncio.sleep(seconds)
+
+    async def _call(self, callback, args, kwargs, endpoint):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(endpoint, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - started)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate_per_minute / 60, self.group_rate_per_minute)
+            else:
+                bucket = TokenBucket(self.private_rate, 1)
+            self._chat_buckets.put(chat_id, bucket)
+        return bucket
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self.global_bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                self.global_bucket.take()
+                future.set_result(None)
@@ -0,0 +1,231 @@
+"""Measures bot throughput and latency against a fake Bot API and a local Postgres.
+
+Starts bot.py in polling mode against an in-process fake Bot API, then walks
+synthetic applicants through the real handlers: /start, name, age, city and
+phone, an admin opening a chat with them, and a few rounds of admin and
+applicant messages relayed through the forum topic. Each applicant waits for
+the bot's reply before its next step, and --concurrency applicants run at a
+time. Reports updates per second and p50/p99 from queueing an update to the
+bot's final API call for it, per step and overall.
+
+    DATABASE_URL=postgresql://localhost/bench python throughput_benchmark.py --applicants 500 --concurrency 50 --api-latency 0.03
+
+The bot's own send rate limits are lifted unless --keep-rate-limits is given.
+Rows created for the synthetic applicants are deleted afterwards unless
+--keep-data is given.
+"""
+import os
+import sys
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+import psycopg
+from fake_bot_api import FakeBotApi
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+GROUP_ID = -1009999999999
+ADMIN_ID = 4242
+
+latencies = defaultdict(list)  # step -> seconds
+timeouts = defaultdict(int)
+waiting = {}  # reply key -> future
+
+
+def reply_key(method, params):
+    if method == "answerCallbackQuery":
+        return ("callback", str(params.get("callback_query_id")))
+    chat_id = params.get("chat_id")
+    if chat_id is None:
+        return None
+    chat_id = int(chat_id)
+    if chat_id == GROUP_ID:
+        thread_id = params.get("message_thread_id")
+        return ("topic", int(thread_id)) if thread_id is not None else None
+    return ("chat", chat_id)
+
+
+def on_api_call(method, params):
+    future = waiting.pop(reply_key(method, params), None)
+    if future is not None and not future.done():
+        future.set_result(time.perf_counter())
+
+
+def private_message(user_id, text):
+    message = {
+        "message_id": int(time.time() * 1000) % 1000000000,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": message}
+
+
+def topic_message(thread_id, text):
+    return {"message": {
+        "message_id": int(time.time() * 1000) % 1000000000,
+        "date": int(time.time()),
+        "chat": {"id": GROUP_ID, "type": "supergroup", "is_forum": True},
+        "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+        "message_thread_id": thread_id,
+        "is_topic_message": True,
+        "text": text,
+    }}
+
+
+def callback(callback_id, data):
+    return {"callback_query": {
+        "id": callback_id,
+        "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+        "chat_instance": "bench",
+        "data": data,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": GROUP_ID, "type": "supergroup", "is_forum": True},
+            "text": "application",
+        },
+    }}
+
+
+async def step(api, name, update, key, timeout):
+    future = asyncio.get_running_loop().create_future()
+    waiting[key] = future
+    started = time.perf_counter()
+    api.push_update(update)
+    try:
+        finished = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        waiting.pop(key, None)
+        timeouts[name] += 1
+        return False
+    latencies[name].append(finished - started)
+    return True
+
+
+async def run_applicant(api, args, user_id):
+    steps = [
+        ("start", "/start"), ("name", f"Bench {user_id}"), ("age", "25"), ("city", "Kyiv"), ("phone", "0931231919"),
+    ]
+    for name, text in steps:
+        if not await step(api, name, private_message(user_id, text), ("chat", user_id), args.timeout):
+            return
+
+    callback_id = f"cb{uuid.uuid4().hex}"
+    if not await step(api, "open_chat", callback(callback_id, f"start_chat:{user_id}"), ("callback", callback_id), args.timeout):
+        return
+    thread_id = api.topics.get(f"Чат: Bench {user_id} (@bench{user_id})")
+    if thread_id is None:
+        timeouts["open_chat"] += 1
+        return
+
+    for i in range(args.rounds):
+        if not await step(api, "admin_message", topic_message(thread_id, f"Question {i}"), ("chat", user_id), args.timeout):
+            return
+        if not await step(api, "applicant_message", private_message(user_id, f"Answer {i}"), ("topic", thread_id), args.timeout):
+            return
+
+
+def summary(name, values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return (f"{name:<18} n={len(values):<6} mean={statistics.mean(values) * 1000:7.1f}ms "
+            f"p50={pick(0.5):7.1f}ms p99={pick(0.99):7.1f}ms max={values[-1] * 1000:7.1f}ms")
+
+
+def cleanup(database_url, first_id, count):
+    ids = list(range(first_id, first_id + count))
+    with psycopg.connect(database_url) as conn:
+        conn.execute("DELETE FROM topic_mappings WHERE telegram_id = ANY(%s)", (ids,))
+        conn.execute("DELETE FROM message_log WHERE telegram_id = ANY(%s)", (ids,))
+        conn.execute("DELETE FROM persisted_user_data WHERE user_id = ANY(%s)", (ids,))
+        conn.execute("DELETE FROM applicants WHERE telegram_id = ANY(%s)", (ids,))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="applicants in flight at once")
+    parser.add_argument("--rounds", type=int, default=2, help="admin/applicant message exchanges per applicant")
+    parser.add_argument("--api-latency", type=float, default=0.03, help="seconds the fake Bot API takes per call")
+    parser.add_argument("--api-port", type=int, default=8082)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for the bot's reply to one update")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--bot-log", default=os.devnull, help="file for the bot's output")
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    parser.add_argument("--keep-data", action="store_true")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    api = FakeBotApi(latency=args.api_latency)
+    api.listeners.append(on_api_call)
+    api.application().listen(args.api_port, "127.0.0.1")
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN=os.getenv("BENCHMARK_BOT_TOKEN", "123456:benchmark"),
+        ADMIN_TOKEN_SECRET=os.getenv("ADMIN_TOKEN_SECRET", "benchmark"),
+        DATABASE_URL=args.database_url,
+        GROUP_ID=str(GROUP_ID),
+        ADMIN_ID=str(ADMIN_ID),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}/bot",
+        WEBHOOK_URL="",
+        PYTHONUNBUFFERED="1",
+    )
+    if not args.keep_rate_limits:
+        env.update(SEND_GLOBAL_RATE="100000", SEND_PRIVATE_CHAT_RATE="100000", SEND_GROUP_RATE_PER_MINUTE="6000000")
+
+    first_id = int(time.time()) * 1000
+    with open(args.bot_log, "w") as log:
+        bot = subprocess.Popen([sys.executable, BOT_SCRIPT], env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            print(f"🧪 Fake Bot API on port {args.api_port} ({args.api_latency * 1000:.0f}ms per call), waiting for the bot to poll")
+            polling = asyncio.ensure_future(api.polling.wait())
+            while not polling.done():
+                if bot.poll() is not None:
+                    sys.exit(f"❌ bot.py exited with code {bot.returncode}, see --bot-log")
+                await asyncio.sleep(0.1)
+
+            print(f"🏃 {args.applicants} applicants, {args.concurrency} at a time, {args.rounds} message rounds each")
+            slots = asyncio.Semaphore(args.concurrency)
+
+            async def limited(user_id):
+                async with slots:
+                    await run_applicant(api, args, user_id)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(limited(first_id + i) for i in range(args.applicants)))
+            elapsed = time.perf_counter() - started
+        finally:
+            bot.send_signal(signal.SIGINT)
+            # The fake API has to keep serving while the bot shuts down
+            try:
+                await asyncio.to_thread(bot.wait, 30)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+            await api.close()
+
+    completed = sum(len(v) for v in latencies.values())
+    print(f"\n✅ {completed} updates in {elapsed:.1f}s: {completed / elapsed:.1f} updates/s")
+    for name in ("start", "name", "age", "city", "phone", "open_chat", "admin_message", "applicant_message"):
+        if latencies[name]:
+            print(summary(name, latencies[name]))
+    print(summary("all", [v for values in latencies.values() for v in values]))
+    if timeouts:
+        print(f"⚠️ Timed out: {dict(timeouts)}")
+    print("📞 Bot API calls: " + ", ".join(f"{method}={count}" for method, count in api.calls.most_common()))
+
+    if not args.keep_data:
+        cleanup(args.database_url, first_id, args.applicants)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
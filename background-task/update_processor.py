@@ -0,0 +1,76 @@
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# The base class semaphore is taken before the per-chat lock, so it only bounds
+# how many updates may be waiting; the real limit is applied after the lock
+MAX_WAITING_UPDATES = 10000
+
+
+def chat_order_key(update):
+    """Updates with the same key are processed in the order they arrived."""
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    if chat is None:
+        user = update.effective_user
+        return (user.id, None) if user else None
+    message = update.effective_message
+    if message is not None and getattr(message, "is_topic_message", False):
+        # Forum topics are independent conversations
+        return (chat.id, message.message_thread_id)
+    return (chat.id, None)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes up to max_concurrent_updates updates at once, one at a time per key.
+
+    Updates waiting for an earlier update with the same key do not take up a
+    slot, so one busy chat cannot hold back the others.
+    """
+
+    def __init__(self, max_concurrent_updates, key_func=chat_order_key):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(MAX_WAITING_UPDATES)
+        self.limit = max_concurrent_updates
+        self.key_func = key_func
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._queues = {}  # key -> [lock, number of updates holding or waiting for it]
+        self._running = 0
+
+    @property
+    def running_updates(self):
+        return self._running
+
+    async def do_process_update(self, update, coroutine):
+        key = self.key_func(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = [asyncio.Lock(), 0]
+        queue[1] += 1
+        try:
+            async with queue[0]:
+                await self._run(coroutine)
+        finally:
+            queue[1] -= 1
+            if not queue[1]:
+                del self._queues[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
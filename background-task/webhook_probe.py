@@ -0,0 +1,116 @@
+"""Measures update-to-handler latency of the bot in webhook mode.
+
+Runs a fake Bot API server and POSTs synthetic /start updates to the bot's
+webhook, one private chat per update. The time until the bot's reply for
+that chat reaches the fake API is the update-to-handler latency.
+
+Start the probe first, then the bot against its fake API; posting begins
+once the bot has registered its webhook:
+
+    python webhook_probe.py --count 200 --rate 20
+    WEBHOOK_URL=http://127.0.0.1:8443 TELEGRAM_API_URL=http://127.0.0.1:8081/bot python bot.py
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import statistics
+from tornado.httpclient import AsyncHTTPClient
+from fake_bot_api import FakeBotApi
+
+pending = {}  # chat_id -> time the update was posted
+latencies = []
+
+
+def record_reply(method, params):
+    chat_id = params.get("chat_id")
+    if chat_id is not None:
+        posted_at = pending.pop(int(chat_id), None)
+        if posted_at is not None:
+            latencies.append(time.perf_counter() - posted_at)
+
+
+def synthetic_update(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Probe"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def post_update(client, args, update_id, chat_id, accept_times):
+    started = time.perf_counter()
+    pending[chat_id] = started
+    response = await client.fetch(
+        args.webhook,
+        method="POST",
+        body=json.dumps(synthetic_update(update_id, chat_id)),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": args.secret},
+        raise_error=False,
+    )
+    if response.code != 200:
+        pending.pop(chat_id, None)
+        print(f"❌ Update {update_id} rejected with HTTP {response.code}")
+    else:
+        accept_times.append(time.perf_counter() - started)
+
+
+def summary(name, values):
+    if not values:
+        return f"{name}: no samples"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return (f"{name}: n={len(values)} mean={statistics.mean(values) * 1000:.1f}ms "
+            f"p50={pick(0.5):.1f}ms p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms max={values[-1] * 1000:.1f}ms")
+
+
+async def main():
+    token = os.getenv("BOT_TOKEN") or ""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--webhook", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{token}".encode()).hexdigest())
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10, help="updates per second")
+    # Fresh chats every run: /start is ignored in a chat that is still inside the application conversation
+    parser.add_argument("--first-chat-id", type=int, default=int(time.time()) * 100000)
+    parser.add_argument("--wait", type=float, default=10, help="seconds to wait for outstanding replies")
+    args = parser.parse_args()
+
+    api = FakeBotApi()
+    api.listeners.append(record_reply)
+    api.application().listen(args.api_port, "127.0.0.1")
+    print(f"🧪 Fake Bot API on http://127.0.0.1:{args.api_port}/bot, waiting for the bot to set its webhook")
+    await api.webhook_set.wait()
+    await asyncio.sleep(0.5)
+    print(f"📨 Posting {args.count} updates to {args.webhook} at {args.rate}/s")
+
+    client = AsyncHTTPClient()
+    accept_times = []
+    tasks = []
+    update_id = int(time.time())
+    for i in range(args.count):
+        tasks.append(asyncio.create_task(post_update(client, args, update_id + i, args.first_chat_id + i, accept_times)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+
+    deadline = time.perf_counter() + args.wait
+    while pending and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+    print(summary("webhook accepted", accept_times))
+    print(summary("update to handler reply", latencies))
+    if pending:
+        print(f"⚠️ {len(pending)} updates got no reply within {args.wait}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
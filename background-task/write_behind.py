@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Queues message_log and message_reactions writes and stores them in batches.
+
+    A flush runs once max_rows writes are pending, every flush_interval
+    seconds, and on close(). Rows that fail to flush are kept for the next
+    attempt, up to max_pending rows.
+    """
+
+    def __init__(self, pool, max_rows=100, flush_interval=1.0, max_pending=10000):
+        self.pool = pool
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._messages = []
+        self._reactions = {}  # (message_id, user_id) -> [reaction, is_admin, row_exists]
+        self._flushing_messages = []
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._flush_task = None
+        self._flush_scheduled = False
+        self._wakeup = asyncio.Event()
+        self._closing = False
+
+    def __len__(self):
+        return len(self._messages) + len(self._reactions)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # Not cancelled: a flush cut off mid-COPY would lose its rows instead of requeueing them
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    def add_message(self, admin_message_id, user_message_id, telegram_id, thread_id, message_type):
+        self._messages.append((admin_message_id, user_message_id, telegram_id, thread_id, message_type))
+        self._maybe_flush()
+
+    def add_reaction(self, message_id, user_id, reaction, is_admin, row_exists):
+        pending = self._reactions.get((message_id, user_id))
+        if pending is not None:
+            # Several changes inside one window collapse into the latest reaction
+            pending[0] = reaction
+        else:
+            self._reactions[(message_id, user_id)] = [reaction, is_admin, row_exists]
+        self._maybe_flush()
+
+    def find_message_pair(self, admin_message_id=None, user_message_id=None, telegram_id=None):
+        # Rows still waiting for a flush are searched newest first; broadcasts have no admin side to pair with
+        for row in reversed(self._flushing_messages + self._messages):
+            if row[0] is None:
+                continue
+            if admin_message_id is not None and row[0] == admin_message_id:
+                return row[:4]
+            if user_message_id is not None and row[1] == user_message_id and row[2] == telegram_id:
+                return row[:4]
+        return None
+
+    async def flush(self):
+        async with self._lock:
+            self._flush_scheduled = False
+            messages, self._messages = self._messages, []
+            reactions, self._reactions = self._reactions, {}
+            if not messages and not reactions:
+                return
+
+            self._flushing_messages = messages
+            try:
+                async with self.pool.connection() as conn:
+                    async with conn.cursor() as cur:
+                        if messages:
+                            async with cur.copy("""
+                                COPY message_log (admin_message_id, user_message_id, telegram_id, thread_id, message_type)
+                                FROM STDIN
+                            """) as copy:
+                                for row in messages:
+                                    await copy.write_row(row)
+
+                        updates = [(r, m, u) for (m, u), (r, _, exists) in reactions.items() if exists]
+                        inserts = [(m, u, r, a) for (m, u), (r, a, exists) in reactions.items() if not exists]
+                        if updates:
+                            await cur.executemany("""
+                                UPDATE message_reactions
+                                SET reaction = %s
+                                WHERE message_id = %s AND user_id = %s
+                            """, updates)
+                        if inserts:
+                            await cur.executemany("""
+                                INSERT INTO message_reactions (message_id, user_id, reaction, is_admin)
+                                VALUES (%s, %s, %s, %s)
+                                ON CONFLICT (message_id, user_id) DO UPDATE SET reaction = EXCLUDED.reaction
+                            """, inserts)
+                logger.info(f"💾 Flushed {len(messages)} message log rows and {len(reactions)} reactions")
+            except Exception as e:
+                logger.error(f"❌ Write-behind flush failed, keeping rows for retry: {str(e)}")
+                self._requeue(messages, reactions)
+            finally:
+                self._flushing_messages = []
+
+    def _requeue(self, messages, reactions):
+        self._messages[:0] = messages
+        for key, value in reactions.items():
+            pending = self._reactions.get(key)
+            if pending is None:
+                self._reactions[key] = value
+            else:
+                # A newer change arrived meanwhile; keep it, but remember whether the row exists
+                pending[2] = value[2]
+
+        overflow = len(self._messages) - self.max_pending
+        if overflow > 0:
+            logger.error(f"❌ Write-behind buffer full, dropping {overflow} oldest message log rows")
+            del self._messages[:overflow]
+
+    def _maybe_flush(self):
+        if len(self) >= self.max_rows and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._closing:
+                return
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Error in write-behind flush loop: {str(e)}")